@@ -0,0 +1,51 @@
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+
+def increment(queryset, **deltas):
+    """Atomically add ``deltas`` to counter columns of ``queryset`` rows.
+
+    Counters never go below zero, so a row that drifted (e.g. after bulk
+    inserts) cannot break a request; ``reconcile_counters`` repairs it.
+    """
+    return queryset.update(
+        **{
+            field: (
+                Greatest(F(field) + delta, Value(0)) if delta < 0 else F(field) + delta
+            )
+            for field, delta in deltas.items()
+        }
+    )
+
+
+def increment_returning(model, pk, fields, **deltas):
+    """Add ``deltas`` to one row and load it in the same statement.
+
+    Works like ``increment`` but uses ``UPDATE ... RETURNING`` to return
+    the updated instance with ``fields`` loaded, or ``None`` if there is no
+    such row.
+    """
+    opts = model._meta
+    quote = connection.ops.quote_name
+    assignments = []
+    params = []
+    for name, delta in deltas.items():
+        column = quote(opts.get_field(name).column)
+        if delta < 0:
+            assignments.append(
+                f"{column} = CASE WHEN {column} > %s THEN {column} - %s ELSE 0 END"
+            )
+            params += [-delta, -delta]
+        else:
+            assignments.append(f"{column} = {column} + %s")
+            params.append(delta)
+    columns = [opts.pk.column] + [opts.get_field(name).column for name in fields]
+    sql = (
+        f"UPDATE {quote(opts.db_table)} SET {', '.join(assignments)} "
+        f"WHERE {quote(opts.pk.column)} = %s "
+        f"RETURNING {', '.join(quote(column) for column in columns)}"
+    )
+    # Fetch everything: a half-read cursor may leave the UPDATE unfinished.
+    rows = list(model.objects.raw(sql, [*params, pk]))
+    return rows[0] if rows else None
@@ -0,0 +1,83 @@
+import os
+
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# With PROMETHEUS_MULTIPROC_DIR set, every process writes its samples to
+# memory-mapped files in that directory and the view sums them up, so the
+# numbers cover all gunicorn workers.
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUESTS = Counter(
+    "foodgram_http_requests_total",
+    "Handled requests.",
+    ["route", "action", "method", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "foodgram_http_request_duration_seconds",
+    "Time spent handling a request.",
+    ["route", "action"],
+)
+DB_QUERIES = Histogram(
+    "foodgram_db_queries_per_request",
+    "SQL statements executed per request.",
+    ["route", "action"],
+    buckets=QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    "foodgram_db_duration_seconds",
+    "Time spent in the database per request.",
+    ["route", "action"],
+)
+CACHE_LOOKUPS = Counter(
+    "foodgram_cache_lookups_total",
+    "Cache lookups; the hit ratio is hits over all lookups.",
+    ["cache", "result"],
+)
+FAVORITES_ADDED = Counter("foodgram_favorites_added_total", "Recipes favorited.")
+SHOPPING_CARTS_DOWNLOADED = Counter(
+    "foodgram_shopping_carts_downloaded_total",
+    "Shopping lists downloaded.",
+    ["format"],
+)
+IMAGES_DECODED = Counter(
+    "foodgram_images_decoded_total",
+    "Base64 images decoded from requests or the image queue.",
+    ["result"],
+)
+
+
+def observe_request(route, action, method, status, duration, queries, db_duration):
+    route = route or "unmatched"
+    action = action or ""
+    REQUESTS.labels(route, action, method, status).inc()
+    REQUEST_DURATION.labels(route, action).observe(duration)
+    DB_QUERIES.labels(route, action).observe(queries)
+    DB_DURATION.labels(route, action).observe(db_duration)
+
+
+def get_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Expose the metrics in the Prometheus text format."""
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -1,7 +1,78 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+# Below this many estimated rows an exact COUNT(*) is cheap enough.
+EXACT_COUNT_THRESHOLD = 1000
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for ``queryset`` on PostgreSQL.
+
+    Other databases, and small results where the estimate is unreliable,
+    get an exact count.
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.count()
+    plan = json.loads(queryset.explain(format="json"))
+    estimate = plan[0]["Plan"]["Plan Rows"]
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class ApproximateCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """Page-number pagination; ``?count=approximate`` skips the exact COUNT."""
+
+    page_size_query_param = "limit"
+    page_size = 6
+    max_page_size = 100
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.count_query_param) == "approximate":
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(CursorPagination):
     page_size_query_param = "limit"
     page_size = 6
     max_page_size = 100
+    ordering = ("-pub_date", "-id")
+
+
+class KeysetOrPageNumberPagination(CustomPageNumberPagination):
+    """Page-number pagination with an opt-in keyset mode.
+
+    Requests with ``?paginate=cursor`` (or a ``cursor`` from a previous
+    response) are paginated by ``keyset_pagination_class``, which never
+    runs ``OFFSET`` or ``COUNT(*)`` and so costs the same on every page.
+    """
+
+    keyset_pagination_class = KeysetPagination
+    mode_query_param = "paginate"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.keyset_pagination_class.cursor_query_param in request.query_params
+        ):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
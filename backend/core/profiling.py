@@ -0,0 +1,187 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar("current_profile", default=None)
+
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+NUMBER_RE = re.compile(r"\b\d+\b")
+# Duplicate fingerprints reported per request.
+MAX_DUPLICATES = 5
+# A statement repeated this often in one request is likely an N+1.
+N_PLUS_ONE_THRESHOLD = 5
+
+
+def fingerprint(sql):
+    """Collapse a statement to its shape: no parameter lists or numbers."""
+    return NUMBER_RE.sub("?", IN_LIST_RE.sub("IN (...)", sql))
+
+
+class RequestProfile:
+    """Database and serializer costs collected while handling one request."""
+
+    def __init__(self, capture_sql=False):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.fingerprints = Counter()
+        self.capture_sql = capture_sql
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper, see ``connection.execute_wrapper``."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            self.fingerprints[fingerprint(sql)] += 1
+            if self.capture_sql:
+                self.sql.append({"sql": sql, "ms": round(duration * 1000, 3)})
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def duplicates(self):
+        return {
+            sql: count
+            for sql, count in self.fingerprints.most_common(MAX_DUPLICATES)
+            if count > 1
+        }
+
+    @contextmanager
+    def track(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            token = current_profile.set(self)
+            try:
+                yield self
+            finally:
+                current_profile.reset(token)
+
+
+def timed_data(fget):
+    """Wrap ``Serializer.data`` so that its outermost call is timed."""
+
+    def data(serializer):
+        profile = current_profile.get()
+        if profile is None:
+            return fget(serializer)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return fget(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+
+    data.profiled = True
+    return data
+
+
+def install_serializer_timing():
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        fget = cls.__dict__["data"].fget
+        if not getattr(fget, "profiled", False):
+            cls.data = property(timed_data(fget))
+
+
+def server_timing(profile, total):
+    return ", ".join(
+        [
+            f'db;dur={profile.db_time * 1000:.1f};desc="{profile.queries} queries"',
+            f"serialize;dur={profile.serializer_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+    )
+
+
+class PerformanceMiddleware:
+    """Record query count, DB time, duplicate queries, serializer time and
+    response size of every request.
+
+    The numbers are sent back in a ``Server-Timing`` header and logged as one
+    JSON line, as a warning for slow requests and likely N+1 queries;
+    ``PERF_SQL_SAMPLE_RATE`` of the requests also log every SQL statement.
+    Queries run while a streaming response is consumed are not included.
+
+    With ``METRICS_ENABLED`` the same numbers feed the ``/metrics``
+    histograms; either setting alone keeps the middleware installed.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.PERF_PROFILING or settings.METRICS_ENABLED):
+            raise MiddlewareNotUsed
+        install_serializer_timing()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile(
+            capture_sql=settings.PERF_PROFILING
+            and random.random() < settings.PERF_SQL_SAMPLE_RATE
+        )
+        with profile.track():
+            response = self.get_response(request)
+        total = profile.total_time
+        record = self.describe(request, response, profile, total)
+        if settings.METRICS_ENABLED:
+            metrics.observe_request(
+                record["view"],
+                record["action"],
+                request.method,
+                response.status_code,
+                total,
+                profile.queries,
+                profile.db_time,
+            )
+        if settings.PERF_PROFILING:
+            response["Server-Timing"] = server_timing(profile, total)
+            suspicious = total * 1000 >= settings.PERF_SLOW_REQUEST_MS or any(
+                count >= N_PLUS_ONE_THRESHOLD for count in profile.fingerprints.values()
+            )
+            logger.log(
+                logging.WARNING if suspicious else logging.INFO, json.dumps(record)
+            )
+        return response
+
+    def describe(self, request, response, profile, total):
+        match = request.resolver_match
+        view = getattr(match, "func", None)
+        actions = getattr(view, "actions", None) or {}
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "action": actions.get(request.method.lower()),
+            "status": response.status_code,
+            "queries": profile.queries,
+            "db_ms": round(profile.db_time * 1000, 3),
+            "serialize_ms": round(profile.serializer_time * 1000, 3),
+            "total_ms": round(total * 1000, 3),
+            "response_bytes": (None if response.streaming else len(response.content)),
+            "duplicates": profile.duplicates(),
+        }
+        if profile.capture_sql:
+            record["sql"] = profile.sql
+        return record
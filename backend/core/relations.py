@@ -0,0 +1,94 @@
+from django.db import connection
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def add(model, user_id, target_field, target_id):
+    """Link ``user_id`` to ``target_id`` through ``model`` in one statement.
+
+    ``INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING`` inserts the
+    row only if the target exists and the pair is not linked yet, so
+    concurrent requests cannot fail on the unique constraint. Returns
+    whether a row was inserted. Sends no ``post_save`` signal.
+    """
+    opts = model._meta
+    target = opts.get_field(target_field)
+    target_opts = target.related_model._meta
+    sql = (
+        f"INSERT INTO {_quote(opts.db_table)} "
+        f"({_quote(opts.get_field('user').column)}, {_quote(target.column)}) "
+        f"SELECT %s, {_quote(target_opts.pk.column)} "
+        f"FROM {_quote(target_opts.db_table)} "
+        f"WHERE {_quote(target_opts.pk.column)} = %s "
+        f"ON CONFLICT DO NOTHING RETURNING {_quote(opts.pk.column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, target_id])
+        return cursor.fetchone() is not None
+
+
+def remove(model, user_id, target_field, target_id):
+    """Unlink ``user_id`` from ``target_id`` with one ``DELETE ... RETURNING``.
+
+    Returns whether a row was deleted. Sends no ``post_delete`` signal.
+    """
+    opts = model._meta
+    sql = (
+        f"DELETE FROM {_quote(opts.db_table)} "
+        f"WHERE {_quote(opts.get_field('user').column)} = %s "
+        f"AND {_quote(opts.get_field(target_field).column)} = %s "
+        f"RETURNING {_quote(opts.pk.column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, target_id])
+        return cursor.fetchone() is not None
+
+
+def bulk_add(model, user_id, target_field, target_ids):
+    """Link ``user_id`` to every existing target in ``target_ids`` at once.
+
+    One ``INSERT ... SELECT`` skips unknown targets and existing links; a
+    second query, run only if some ids were not linked, tells the two apart.
+    Returns ``(added, missing)`` sets of ids. Sends no ``post_save`` signal.
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return set(), set()
+    opts = model._meta
+    target = opts.get_field(target_field)
+    target_model = target.related_model
+    target_pk = _quote(target_model._meta.pk.column)
+    placeholders = ", ".join(["%s"] * len(target_ids))
+    sql = (
+        f"INSERT INTO {_quote(opts.db_table)} "
+        f"({_quote(opts.get_field('user').column)}, {_quote(target.column)}) "
+        f"SELECT %s, {target_pk} FROM {_quote(target_model._meta.db_table)} "
+        f"WHERE {target_pk} IN ({placeholders}) "
+        f"ON CONFLICT DO NOTHING RETURNING {_quote(target.column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        added = {row[0] for row in cursor.fetchall()}
+    rest = set(target_ids) - added
+    if not rest:
+        return added, set()
+    found = target_model.objects.filter(pk__in=rest).values_list("pk", flat=True)
+    return added, rest - set(found)
+
+
+def bulk_results(ids, added, missing, exists_error, missing_error, rejected=None):
+    """Per-id outcome of a bulk add, with the single endpoints' statuses."""
+    rejected = rejected or {}
+    results = []
+    for pk in ids:
+        if pk in added:
+            results.append({"id": pk, "status": 201})
+        elif pk in rejected:
+            results.append({"id": pk, "status": 400, "errors": rejected[pk]})
+        elif pk in missing:
+            results.append({"id": pk, "status": 404, "errors": missing_error})
+        else:
+            results.append({"id": pk, "status": 400, "errors": exists_error})
+    return results
@@ -0,0 +1,73 @@
+from PIL import features
+from sorl.thumbnail import get_thumbnail
+
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+RECIPE_THUMBNAIL_WIDTH = 640
+AVATAR_WIDTHS = (64, 128, 256)
+AVATAR_THUMBNAIL_WIDTH = 128
+
+FALLBACK_FORMAT = "JPEG"
+QUALITY = 80
+
+
+def get_formats():
+    """Variant formats, most efficient first, ending with the JPEG fallback."""
+    formats = ["WEBP", FALLBACK_FORMAT]
+    if features.check("avif"):
+        formats.insert(0, "AVIF")
+    return formats
+
+
+def generate_variants(field_file, widths):
+    """Render resized copies of an image in every format with sorl.
+
+    Returns ``{"source": name, "<format>": {"<width>": {"name", "width"}}}``
+    that is stored next to the image, so serializers can build URLs without
+    touching storage or sorl's key-value store. Images are not upscaled:
+    ``width`` is the real width of the copy, and widths past the source's
+    share its full-size copy.
+    """
+    if not field_file or not field_file.storage.exists(field_file.name):
+        return {}
+    variants = {"source": field_file.name}
+    for image_format in get_formats():
+        sizes = {}
+        full_size = None
+        for width in sorted(widths):
+            if full_size is None:
+                thumb = get_thumbnail(
+                    field_file,
+                    str(width),
+                    format=image_format,
+                    quality=QUALITY,
+                    upscale=False,
+                )
+                variant = {"name": thumb.name, "width": thumb.width}
+                if thumb.width < width:
+                    full_size = variant
+            sizes[str(width)] = full_size or variant
+        variants[image_format.lower()] = sizes
+    return variants
+
+
+def variants_are_current(field_file, variants):
+    if not field_file:
+        return not variants
+    return bool(variants) and variants.get("source") == field_file.name
+
+
+def update_variants(instance, field_name, widths, force=False):
+    """(Re)generate the variants of ``instance.<field_name>`` if outdated.
+
+    The result is written with a queryset update so that no save signals
+    fire again.
+    """
+    field_file = getattr(instance, field_name)
+    variants_field = f"{field_name}_variants"
+    current = getattr(instance, variants_field)
+    if not force and variants_are_current(field_file, current):
+        return current
+    variants = generate_variants(field_file, widths)
+    setattr(instance, variants_field, variants)
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: variants})
+    return variants
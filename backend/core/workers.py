@@ -0,0 +1,11 @@
+import django
+from django.apps import apps
+from django.db import connections
+
+
+def init_worker():
+    """Prepare a ``ProcessPoolExecutor`` worker to use the ORM."""
+    if not apps.ready:
+        django.setup()
+    # Never reuse a connection inherited from the parent process.
+    connections.close_all()
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.profiling.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -63,6 +64,53 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Limits for uploaded images; base64 JSON bodies must fit the decoded limit
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv("IMAGE_UPLOAD_MAX_PIXELS", 40_000_000))
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_BYTES * 4 // 3 + 64 * 1024
+
+# Decode uploaded recipe images and avatars in `process_image_jobs` workers
+IMAGE_PROCESSING_ASYNC = os.getenv("IMAGE_PROCESSING_ASYNC", "False") == "True"
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv("IMAGE_JOB_MAX_ATTEMPTS", "5"))
+# Seconds before the first retry, doubled after every failed attempt
+IMAGE_JOB_RETRY_DELAY = int(os.getenv("IMAGE_JOB_RETRY_DELAY", "30"))
+# Seconds after which a job locked by a dead worker is picked up again
+IMAGE_JOB_LEASE = int(os.getenv("IMAGE_JOB_LEASE", "300"))
+
+# Per-request query/timing profile, sent as Server-Timing and logged as JSON
+PERF_PROFILING = os.getenv("PERF_PROFILING", "True") == "True"
+# Fraction of requests whose SQL statements are logged in full
+PERF_SQL_SAMPLE_RATE = float(os.getenv("PERF_SQL_SAMPLE_RATE", "0.01"))
+# Requests slower than this are logged as warnings
+PERF_SLOW_REQUEST_MS = int(os.getenv("PERF_SLOW_REQUEST_MS", "500"))
+
+# Prometheus metrics served at /metrics. Set PROMETHEUS_MULTIPROC_DIR in
+# the environment to aggregate them over several worker processes.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "core.profiling": {
+            "handlers": ["console"],
+            "level": os.getenv("PERF_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+    },
+}
+
+# Serve ingredient autocomplete from an in-process prefix index
+INGREDIENT_SEARCH_INDEX = os.getenv("INGREDIENT_SEARCH_INDEX", "True") == "True"
+
+# TrueType font with Cyrillic glyphs for the PDF shopping list export
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    "SHOPPING_LIST_PDF_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+
 
 INTERNAL_IPS = [
     "127.0.0.1",
@@ -99,6 +147,22 @@ DATABASES = {
 }
 
 
+# Cache; must be shared by all processes (e.g. memcached) once there is more
+# than one, such as gunicorn workers or `process_image_jobs`
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Cache alias and lifetime for anonymous recipe list/detail responses
+RECIPES_CACHE_ALIAS = os.getenv("RECIPES_CACHE_ALIAS", "default")
+RECIPES_CACHE_TIMEOUT = int(os.getenv("RECIPES_CACHE_TIMEOUT", "300"))
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -135,12 +199,27 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
 }
 
+# Token→user snapshots kept in a shared cache, or per worker without one;
+# per-worker snapshots survive logouts seen by other workers for up to the TTL
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+AUTH_TOKEN_SHARED_CACHE_ALIAS = os.getenv("AUTH_TOKEN_SHARED_CACHE_ALIAS", "")
+
+# Most ids accepted by one bulk favorite, cart or subscribe request
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "100"))
+
+# Recipes of authors with more subscribers are merged into feeds on read
+# instead of being copied into every subscriber's feed
+FEED_FANOUT_MAX_SUBSCRIBERS = int(os.getenv("FEED_FANOUT_MAX_SUBSCRIBERS", "10000"))
+# Newest recipes of an author copied into a feed on subscribe
+FEED_BACKFILL_SIZE = int(os.getenv("FEED_BACKFILL_SIZE", "50"))
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "USER_CREATE_PASSWORD_RETYPE": False,
@@ -25,6 +25,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 # Local application imports
+from core.metrics import metrics_view
 from recipes.views import IngredientViewSet, RecipeViewSet, recipe_short_link_redirect
 from users.views import UserAvatarView, UserViewSet
 
@@ -35,6 +36,7 @@ api_router_v1.register(r"users", UserViewSet, basename="users")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path(
         "s/<int:recipe_id>/",
         recipe_short_link_redirect,
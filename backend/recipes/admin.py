@@ -1,5 +1,7 @@
 from django.contrib import admin
+from . import image_queue, search, shopping_list
 from .models import (
+    ImageJob,
     Recipe,
     Ingredient,
     RecipeIngredient,
@@ -27,8 +29,18 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [RecipeIngredientInline]
     readonly_fields = ("get_favorites_count",)
 
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        old_amounts = shopping_list.get_recipe_amounts(recipe) if change else {}
+        super().save_related(request, form, formsets, change)
+        search.update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        if change:
+            shopping_list.apply_recipe_change(
+                recipe, old_amounts, shopping_list.get_recipe_amounts(recipe)
+            )
+
     def get_favorites_count(self, obj):
-        return obj.favorited_by.count()
+        return obj.favorites_count
 
     get_favorites_count.short_description = "В избранном (раз)"
 
@@ -53,9 +65,36 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "recipe__name")
     autocomplete_fields = ["user", "recipe"]
 
+    def get_readonly_fields(self, request, obj=None):
+        # Stored shopping lists follow added and deleted rows, not edits.
+        if obj is not None:
+            return ("user", "recipe")
+        return ()
+
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ("user", "author")
     search_fields = ("user__username", "author__username")
     autocomplete_fields = ["user", "author"]
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "model_label",
+        "object_id",
+        "field_name",
+        "kind",
+        "status",
+        "attempts",
+        "available_at",
+    )
+    list_filter = ("status", "kind", "model_label")
+    exclude = ("payload",)
+    readonly_fields = ("last_error",)
+    actions = ["requeue"]
+
+    @admin.action(description="Поставить в очередь заново")
+    def requeue(self, request, queryset):
+        image_queue.requeue(queryset)
@@ -0,0 +1,284 @@
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import ingredient_index, response_cache
+from .models import Ingredient, Recipe
+
+User = get_user_model()
+
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baseline.json"
+# The data directory is mounted at /data in the container and lives next
+# to the backend in a checkout.
+INGREDIENT_SOURCES = [
+    Path("/data/ingredients.csv"),
+    Path(settings.BASE_DIR).parent / "data" / "ingredients.csv",
+]
+
+# Row counts passed to ``generate_load_data`` for every dataset size.
+SIZES = {
+    "tiny": {
+        "users": 50,
+        "recipes": 200,
+        "favorites": 1_000,
+        "carts": 200,
+        "subscriptions": 300,
+    },
+    "small": {
+        "users": 1_000,
+        "recipes": 10_000,
+        "favorites": 50_000,
+        "carts": 10_000,
+        "subscriptions": 20_000,
+    },
+    "medium": {
+        "users": 10_000,
+        "recipes": 100_000,
+        "favorites": 500_000,
+        "carts": 100_000,
+        "subscriptions": 200_000,
+    },
+}
+
+# Latency differences below this many milliseconds are treated as noise.
+LATENCY_SLACK_MS = 2.0
+
+
+def get_context():
+    """Pick the rows the scenarios work on: the busiest user and recipe."""
+    user = (
+        User.objects.annotate(carts=Count("shopping_cart"))
+        .order_by("-carts", "id")
+        .first()
+    )
+    recipe = Recipe.objects.order_by("-favorites_count", "id").first()
+    toggled = (
+        Recipe.objects.exclude(favorited_by__user=user)
+        .exclude(in_shopping_carts__user=user)
+        .order_by("id")
+        .first()
+    )
+    ingredient = Ingredient.objects.order_by("id").first()
+    return {
+        "token": Token.objects.get_or_create(user=user)[0].key,
+        "recipe": recipe.pk,
+        "author": recipe.author_id,
+        "toggled": toggled.pk,
+        "prefix": ingredient.name[:2],
+        "middle_page": Recipe.objects.count() // 12 + 1,
+    }
+
+
+def toggle(client, url):
+    client.post(url)
+    return client.delete(url)
+
+
+SCENARIOS = {
+    "recipes-list": (False, lambda c, ctx: c.get(reverse("recipe-list"))),
+    "recipes-list-auth": (True, lambda c, ctx: c.get(reverse("recipe-list"))),
+    "recipes-list-deep-page": (
+        False,
+        lambda c, ctx: c.get(reverse("recipe-list"), {"page": ctx["middle_page"]}),
+    ),
+    "recipes-list-cursor": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-list"), {"paginate": "cursor"}),
+    ),
+    "recipes-filter-author": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-list"), {"author": ctx["author"]}),
+    ),
+    "recipes-filter-favorited": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-list"), {"is_favorited": 1}),
+    ),
+    "recipes-filter-cart": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-list"), {"is_in_shopping_cart": 1}),
+    ),
+    "recipes-search": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-list"), {"search": ctx["prefix"]}),
+    ),
+    "recipes-detail": (
+        False,
+        lambda c, ctx: c.get(reverse("recipe-detail", args=[ctx["recipe"]])),
+    ),
+    "recipes-detail-auth": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-detail", args=[ctx["recipe"]])),
+    ),
+    "ingredients-search": (
+        False,
+        lambda c, ctx: c.get(reverse("ingredient-list"), {"name": ctx["prefix"]}),
+    ),
+    "recipes-subscription-feed": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-feed")),
+    ),
+    "users-subscriptions": (
+        True,
+        lambda c, ctx: c.get(reverse("users-subscriptions")),
+    ),
+    "recipes-download-shopping-cart": (
+        True,
+        lambda c, ctx: c.get(reverse("recipe-download-shopping-cart")),
+    ),
+    "recipes-favorite-toggle": (
+        True,
+        lambda c, ctx: toggle(c, reverse("recipe-favorite", args=[ctx["toggled"]])),
+    ),
+    "recipes-shopping-cart-toggle": (
+        True,
+        lambda c, ctx: toggle(
+            c, reverse("recipe-shopping-cart", args=[ctx["toggled"]])
+        ),
+    ),
+}
+
+
+def percentile(values, fraction):
+    """Percentile interpolated between the two nearest samples.
+
+    Picking a sample by rank would make p95 of 20 runs their maximum.
+    """
+    ordered = sorted(values)
+    position = fraction * (len(ordered) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def measure(request, iterations):
+    """Run ``request`` once to warm up, then record queries, time and memory.
+
+    Queries and memory are taken from a single warm run; latency from
+    ``iterations`` further runs.
+    """
+    request()
+    # The query log is a bounded deque; a full one would count nothing.
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            response = request()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    # Read now: every request clears the query log when it starts.
+    query_count = len(queries)
+    if response.status_code >= 400:
+        raise RuntimeError(f"Benchmark request failed: {response.status_code}")
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        request()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "queries": query_count,
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def find_ingredients_source():
+    return next((path for path in INGREDIENT_SOURCES if path.exists()), None)
+
+
+def generate(size, seed=1, ingredients_source=None):
+    """Replace the database contents with a generated dataset."""
+    call_command("flush", interactive=False, verbosity=0)
+    response_cache.get_cache().clear()
+    ingredient_index.invalidate()
+    call_command(
+        "generate_load_data",
+        seed=seed,
+        ingredients_source=ingredients_source or find_ingredients_source(),
+        stdout=StringIO(),
+        **SIZES[size],
+    )
+
+
+def run(iterations=50, scenarios=None):
+    """Measure every scenario against the data currently in the database."""
+    context = get_context()
+    anonymous = APIClient()
+    authenticated = APIClient()
+    authenticated.credentials(HTTP_AUTHORIZATION=f"Token {context['token']}")
+    results = {}
+    for name, (needs_auth, request) in SCENARIOS.items():
+        if scenarios and name not in scenarios:
+            continue
+        client = authenticated if needs_auth else anonymous
+        results[name] = measure(
+            lambda request=request, client=client: request(client, context),
+            iterations,
+        )
+    return results
+
+
+def compare(results, baseline, tolerance=None):
+    """List the metrics in ``results`` that regressed from ``baseline``.
+
+    Query counts must not grow at all. Latency and memory depend on the
+    machine and database engine the baseline was recorded on, so they are
+    only compared when a ``tolerance`` fraction of growth is given.
+    """
+    regressions = []
+    for size, endpoints in results.items():
+        for name, metrics in endpoints.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+            if metrics["queries"] > expected["queries"]:
+                regressions.append(
+                    f"{size} {name}: {metrics['queries']} queries "
+                    f"(baseline {expected['queries']})"
+                )
+            if tolerance is None:
+                continue
+            limit = max(
+                expected["p95_ms"] * (1 + tolerance),
+                expected["p95_ms"] + LATENCY_SLACK_MS,
+            )
+            if metrics["p95_ms"] > limit:
+                regressions.append(
+                    f"{size} {name}: p95 {metrics['p95_ms']} ms "
+                    f"(baseline {expected['p95_ms']} ms)"
+                )
+            if metrics["peak_kb"] > expected["peak_kb"] * (1 + tolerance):
+                regressions.append(
+                    f"{size} {name}: {metrics['peak_kb']} KB allocated "
+                    f"(baseline {expected['peak_kb']} KB)"
+                )
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
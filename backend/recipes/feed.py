@@ -0,0 +1,196 @@
+import base64
+from datetime import datetime
+from heapq import merge
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import FeedEntry, Recipe, Subscription
+
+User = get_user_model()
+
+# Feeds hold ``FeedEntry`` rows for authors with at most
+# ``FEED_FANOUT_MAX_SUBSCRIBERS`` subscribers, copied when a recipe is
+# published (fan-out on write). Recipes of bigger authors would cost too
+# many rows per recipe, so they are merged in when a feed is read.
+
+
+def publish(recipe):
+    """Copy a new recipe into the feeds of its author's subscribers."""
+    quote = connection.ops.quote_name
+    feed = FeedEntry._meta
+    subscription = Subscription._meta
+    author = User._meta
+    author_pk = quote(author.pk.column)
+    sql = (
+        f"INSERT INTO {quote(feed.db_table)} "
+        f"({quote(feed.get_field('user').column)}, "
+        f"{quote(feed.get_field('recipe').column)}, "
+        f"{quote(feed.get_field('pub_date').column)}) "
+        f"SELECT s.{quote(subscription.get_field('user').column)}, %s, %s "
+        f"FROM {quote(subscription.db_table)} s JOIN {quote(author.db_table)} a "
+        f"ON a.{author_pk} = s.{quote(subscription.get_field('author').column)} "
+        f"WHERE a.{author_pk} = %s "
+        f"AND a.{quote(author.get_field('subscribers_count').column)} <= %s "
+        "ON CONFLICT DO NOTHING"
+    )
+    params = [
+        recipe.pk,
+        recipe.pub_date,
+        recipe.author_id,
+        settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def backfill(user_id, author_ids):
+    """Copy the latest recipes of newly followed authors into a feed.
+
+    Only the ``FEED_BACKFILL_SIZE`` newest recipes of each author are
+    copied; older ones stay reachable from the author's page.
+    """
+    recent = (
+        Recipe.objects.filter(
+            author_id__in=author_ids,
+            author__subscribers_count__lte=settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+        )
+        .latest_per_author(settings.FEED_BACKFILL_SIZE)
+        .values_list("id", "pub_date")
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recent
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_ids):
+    """Remove the recipes of unfollowed authors from a feed."""
+    FeedEntry.objects.filter(user_id=user_id, recipe__author_id__in=author_ids).delete()
+
+
+def rebuild(user_ids=None):
+    """Refill feeds from the subscriptions and return the entry count."""
+    entries = FeedEntry.objects.all()
+    subscriptions = Subscription.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        subscriptions = subscriptions.filter(user_id__in=user_ids)
+    entries.delete()
+    authors = {}
+    for user_id, author_id in subscriptions.values_list("user_id", "author_id"):
+        authors.setdefault(user_id, []).append(author_id)
+    for user_id, author_ids in authors.items():
+        backfill(user_id, author_ids)
+    return entries.count()
+
+
+def older_than(position, id_field):
+    pub_date, pk = position
+    return Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, **{f"{id_field}__lt": pk})
+
+
+def read(user, limit, position=None):
+    """Return up to ``limit`` ``(pub_date, recipe_id)`` of a feed, newest first.
+
+    ``position`` is the last pair of the previous page.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    if position:
+        entries = entries.filter(older_than(position, "recipe_id"))
+    pages = [
+        entries.order_by("-pub_date", "-recipe_id").values_list(
+            "pub_date", "recipe_id"
+        )[:limit]
+    ]
+    pulled = list(
+        Subscription.objects.filter(
+            user=user,
+            author__subscribers_count__gt=settings.FEED_FANOUT_MAX_SUBSCRIBERS,
+        ).values_list("author_id", flat=True)
+    )
+    if pulled:
+        recipes = Recipe.objects.filter(author_id__in=pulled)
+        if position:
+            recipes = recipes.filter(older_than(position, "id"))
+        pages.append(
+            recipes.order_by("-pub_date", "-id").values_list("pub_date", "id")[:limit]
+        )
+    items = []
+    seen = set()
+    # An author who outgrew fan-out keeps the entries copied before.
+    for pub_date, recipe_id in merge(*pages, reverse=True):
+        if recipe_id not in seen:
+            seen.add(recipe_id)
+            items.append((pub_date, recipe_id))
+    return items[:limit]
+
+
+def encode_cursor(position):
+    pub_date, pk = position
+    value = f"{pub_date.isoformat()} {pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    pub_date, pk = value.split(" ")
+    return datetime.fromisoformat(pub_date), int(pk)
+
+
+class FeedPagination(BasePagination):
+    """Keyset pages of a feed; ``next`` carries the last ``(pub_date, id)``."""
+
+    page_size = 6
+    max_page_size = 100
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def paginate_feed(self, user, request):
+        """Return the recipe ids of the requested page."""
+        self.request = request
+        position = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+        page_size = self.get_page_size(request)
+        items = read(user, page_size + 1, position)
+        self.next_position = items[page_size - 1] if len(items) > page_size else None
+        return [recipe_id for _, recipe_id in items[:page_size]]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {"next": self.get_next_link(), "previous": None, "results": data}
+        )
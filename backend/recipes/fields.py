@@ -1,14 +1,228 @@
 import base64
+import binascii
+import re
+import string
 import uuid
-from django.core.files.base import ContentFile
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, UnidentifiedImageError
 from rest_framework import serializers
 
+from core import metrics
+
+DATA_URI_RE = re.compile(r"data:image/(?P<ext>[a-z0-9.+-]+);base64,", re.IGNORECASE)
+
+# Base64 characters decoded per step (a multiple of 4).
+CHUNK_SIZE = 64 * 1024
+# Line breaks and other whitespace in the payload are skipped.
+WHITESPACE = str.maketrans("", "", string.whitespace)
+# Decoded bytes kept in memory before the upload spills to a temp file.
+SPOOL_MAX_SIZE = 1024 * 1024
+# Decoded bytes that must be available before the header is sniffed.
+HEADER_SIZE = 64 * 1024
+# Memory used by decoding on top of the request body itself: the spool,
+# the chunk being decoded and its copies while the spool rolls over to disk.
+MEMORY_BOUND = SPOOL_MAX_SIZE + 4 * CHUNK_SIZE
+
+
+class PendingImage:
+    """Data URI accepted as is, to be decoded by the image job queue."""
+
+    def __init__(self, data):
+        self.data = data
+
 
 class Base64ImageField(serializers.ImageField):
+    """Image field that also accepts ``data:image/...;base64,`` strings.
+
+    The payload is decoded chunk by chunk into a spooled temporary file, so
+    decoding never holds more than ``MEMORY_BOUND`` bytes besides the
+    request body. Uploads over ``max_bytes`` are rejected before decoding
+    and images over ``max_pixels`` as soon as their header is read.
+
+    ``deferrable`` fields return a ``PendingImage`` instead of decoding when
+    ``settings.IMAGE_PROCESSING_ASYNC`` is on (see ``recipes.image_queue``).
+    """
+
+    default_error_messages = {
+        "too_large": "Image must not exceed {max_bytes} bytes.",
+        "too_many_pixels": "Image must not exceed {max_pixels} pixels.",
+        "invalid_base64": "Image is not valid base64.",
+    }
+
+    def __init__(
+        self, *args, max_bytes=None, max_pixels=None, deferrable=False, **kwargs
+    ):
+        self.max_bytes = max_bytes or settings.IMAGE_UPLOAD_MAX_BYTES
+        self.max_pixels = max_pixels or settings.IMAGE_UPLOAD_MAX_PIXELS
+        self.deferrable = deferrable
+        super().__init__(*args, **kwargs)
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            id = uuid.uuid4().hex
-            data = ContentFile(base64.b64decode(imgstr), name=f"{id}.{ext}")
+            if self.deferrable and settings.IMAGE_PROCESSING_ASYNC:
+                self.check_length(data)
+                return PendingImage(data)
+            try:
+                image = self.validate_image(self.decode(data))
+            except serializers.ValidationError:
+                metrics.IMAGES_DECODED.labels("rejected").inc()
+                raise
+            metrics.IMAGES_DECODED.labels("accepted").inc()
+            return image
         return super().to_internal_value(data)
+
+    def check_length(self, data):
+        """Check the decoded size limit; returns the match of the prefix."""
+        match = DATA_URI_RE.match(data)
+        if not match:
+            self.fail("invalid_base64")
+        padding = 2 if data.endswith("==") else int(data.endswith("="))
+        if (len(data) - match.end()) * 3 // 4 - padding > self.max_bytes:
+            self.fail("too_large", max_bytes=self.max_bytes)
+        return match
+
+    def decode(self, data):
+        match = self.check_length(data)
+        start = match.end()
+
+        spool = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        sniffed = False
+        # Characters left over when whitespace broke the 4-character groups.
+        pending = ""
+        try:
+            for offset in range(start, len(data), CHUNK_SIZE):
+                end = offset + CHUNK_SIZE
+                pending += data[offset:end].translate(WHITESPACE)
+                usable = len(pending) - len(pending) % 4
+                spool.write(base64.b64decode(pending[:usable], validate=True))
+                pending = pending[usable:]
+                if not sniffed and spool.tell() >= HEADER_SIZE:
+                    sniffed = self.check_header(spool)
+            if pending:
+                self.fail("invalid_base64")
+        except binascii.Error:
+            spool.close()
+            self.fail("invalid_base64")
+        except serializers.ValidationError:
+            spool.close()
+            raise
+        size = spool.tell()
+        spool.seek(0)
+        return UploadedFile(
+            spool,
+            name=f"{uuid.uuid4().hex}.{match['ext'].lower()}",
+            content_type=f"image/{match['ext'].lower()}",
+            size=size,
+        )
+
+    def check_header(self, file):
+        """Reject oversized dimensions from a partially written file.
+
+        Returns whether the header could be read yet.
+        """
+        position = file.tell()
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.fail("too_many_pixels", max_pixels=self.max_pixels)
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            return False
+        finally:
+            file.seek(position)
+        if width * height > self.max_pixels:
+            self.fail("too_many_pixels", max_pixels=self.max_pixels)
+        return True
+
+    def validate_image(self, file):
+        """Validate the decoded image without copying it into memory."""
+        try:
+            with Image.open(file) as image:
+                if image.width * image.height > self.max_pixels:
+                    self.fail("too_many_pixels", max_pixels=self.max_pixels)
+                image.verify()
+                file.image = image
+                file.content_type = Image.MIME.get(image.format)
+        except Image.DecompressionBombError:
+            file.close()
+            self.fail("too_many_pixels", max_pixels=self.max_pixels)
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            file.close()
+            self.fail("invalid_image")
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+
+class ImageVariantField(serializers.Field):
+    """Read-only field exposing the resized variants of an image field.
+
+    ``image_field`` names the model's ``ImageField``; its variants are read
+    from ``<image_field>_variants`` (see ``core.thumbnails``). Until they
+    are generated the original image is used instead.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def build_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_variants(self, instance):
+        variants = getattr(instance, f"{self.image_field}_variants", None) or {}
+        # Variants of a replaced image are ignored until they are rendered again.
+        if variants.get("source") != self.get_original(instance):
+            return {}
+        return variants
+
+    def get_original(self, instance):
+        image = getattr(instance, self.image_field)
+        return image.name if image else None
+
+
+class ThumbnailField(ImageVariantField):
+    """URL of the JPEG variant of the given width."""
+
+    def __init__(self, image_field, width, **kwargs):
+        self.width = width
+        super().__init__(image_field, **kwargs)
+
+    def to_representation(self, instance):
+        variant = self.get_variants(instance).get("jpeg", {}).get(str(self.width))
+        name = variant["name"] if variant else self.get_original(instance)
+        return self.build_url(name)
+
+
+class SrcsetField(ImageVariantField):
+    """``srcset`` strings per format, e.g. ``{"webp": "a.webp 320w, ..."}``.
+
+    Descriptors use the real width of each copy, listed once.
+    """
+
+    def to_representation(self, instance):
+        variants = self.get_variants(instance)
+        return {
+            image_format: self.build_srcset(sizes.values())
+            for image_format, sizes in variants.items()
+            if image_format != "source"
+        }
+
+    def build_srcset(self, sizes):
+        names = {variant["width"]: variant["name"] for variant in sizes}
+        return ", ".join(
+            f"{self.build_url(names[width])} {width}w" for width in sorted(names)
+        )
@@ -1,4 +1,6 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
+from . import search
 from .models import Recipe, Ingredient
 
 
@@ -30,3 +32,17 @@ class IngredientFilter(filters.FilterSet):
     class Meta:
         model = Ingredient
         fields = ["name"]
+
+
+class RecipeSearchFilter(SearchFilter):
+    """Ranked full-text search on PostgreSQL.
+
+    Other databases (SQLite in tests) fall back to the ``icontains`` lookups
+    of ``search_fields``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search.is_supported():
+            return super().filter_queryset(request, queryset, view)
+        return search.search_recipes(queryset, " ".join(terms))
@@ -0,0 +1,274 @@
+import logging
+import time
+import traceback
+import uuid
+from contextlib import nullcontext
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from core import thumbnails
+
+from .fields import SPOOL_MAX_SIZE, Base64ImageField, PendingImage
+from .models import ImageJob, ImageStatus
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+SAVE_OPTIONS = {"JPEG": {"quality": 90, "optimize": True}, "PNG": {"optimize": True}}
+VARIANT_WIDTHS = {
+    ("recipes.Recipe", "image"): thumbnails.RECIPE_IMAGE_WIDTHS,
+    (settings.AUTH_USER_MODEL, "avatar"): thumbnails.AVATAR_WIDTHS,
+}
+
+
+def status_field(field_name):
+    return f"{field_name}_status"
+
+
+def variants_field(field_name):
+    return f"{field_name}_variants"
+
+
+def set_status(instance, field_name, status):
+    """Save the image status so that the usual save signals fire."""
+    setattr(instance, status_field(field_name), status)
+    instance.save(update_fields=[status_field(field_name)])
+
+
+def get_target(job):
+    model = apps.get_model(job.model_label)
+    return model.objects.filter(pk=job.object_id).first()
+
+
+def enqueue(instance, field_name, pending):
+    """Queue ``pending`` for ``instance.<field_name>`` and mark it pending.
+
+    Older jobs for the same field that have not started are superseded.
+    """
+    model_label = instance._meta.label
+    ImageJob.objects.filter(
+        kind=ImageJob.Kind.UPLOAD,
+        model_label=model_label,
+        object_id=instance.pk,
+        field_name=field_name,
+        status=ImageJob.Status.PENDING,
+    ).delete()
+    job = ImageJob.objects.create(
+        model_label=model_label,
+        object_id=instance.pk,
+        field_name=field_name,
+        payload=pending.data,
+    )
+    set_status(instance, field_name, ImageStatus.PENDING)
+    return job
+
+
+def enqueue_variants(instance, field_name):
+    """Queue rendering the variants of ``instance.<field_name>``.
+
+    A job that has not started yet renders the latest image anyway, so
+    none is added next to it.
+    """
+    fields = {
+        "kind": ImageJob.Kind.VARIANTS,
+        "model_label": instance._meta.label,
+        "object_id": instance.pk,
+        "field_name": field_name,
+    }
+    if not ImageJob.objects.filter(status=ImageJob.Status.PENDING, **fields).exists():
+        ImageJob.objects.create(**fields)
+
+
+def schedule_variants(instance, field_name):
+    """Queue the variants of ``instance.<field_name>`` once committed.
+
+    Rendering every format and width takes seconds for large images, so it
+    is left to ``process_image_jobs``; the original image is served until
+    the variants exist.
+    """
+    field_file = getattr(instance, field_name)
+    current = getattr(instance, variants_field(field_name))
+    if not thumbnails.variants_are_current(field_file, current):
+        transaction.on_commit(lambda: enqueue_variants(instance, field_name))
+
+
+def render_variants(instance, field_name):
+    widths = VARIANT_WIDTHS[(instance._meta.label, field_name)]
+    variants = thumbnails.generate_variants(getattr(instance, field_name), widths)
+    setattr(instance, variants_field(field_name), variants)
+
+
+def pop_pending(validated_data, field_name):
+    """Remove a ``PendingImage`` from ``validated_data`` and return it."""
+    if isinstance(validated_data.get(field_name), PendingImage):
+        return validated_data.pop(field_name)
+    return None
+
+
+def due_jobs(now):
+    """Jobs that may be claimed at ``now``, oldest first."""
+    lease_expired = now - timedelta(seconds=settings.IMAGE_JOB_LEASE)
+    return (
+        ImageJob.objects.filter(
+            Q(status=ImageJob.Status.PENDING, available_at__lte=now)
+            | Q(status=ImageJob.Status.PROCESSING, locked_at__lt=lease_expired)
+        )
+        # Repeats the condition of the partial queue index so it is used.
+        .exclude(status=ImageJob.Status.FAILED).order_by("available_at", "id")
+    )
+
+
+def claim():
+    """Lock the next due job for this worker, or return ``None``.
+
+    Jobs whose worker died are picked up again once their lease expired.
+    The conditional UPDATE keeps two workers from claiming the same job;
+    where the database supports it, ``SKIP LOCKED`` also keeps them from
+    competing for the same row.
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    while True:
+        now = timezone.now()
+        with transaction.atomic() if skip_locked else nullcontext():
+            jobs = due_jobs(now)
+            if skip_locked:
+                jobs = jobs.select_for_update(skip_locked=True)
+            job = jobs.only("id", "status", "locked_at").first()
+            if job is None:
+                return None
+            claimed = ImageJob.objects.filter(
+                pk=job.pk, status=job.status, locked_at=job.locked_at
+            ).update(
+                status=ImageJob.Status.PROCESSING,
+                locked_at=now,
+                attempts=F("attempts") + 1,
+            )
+        if claimed:
+            return ImageJob.objects.get(pk=job.pk)
+
+
+def reencode(uploaded):
+    """Apply the EXIF orientation and save the image again without metadata."""
+    with Image.open(uploaded) as source:
+        image_format = "JPEG" if source.format == "MPO" else source.format
+        image = ImageOps.exif_transpose(source)
+        output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        image.save(output, image_format, **SAVE_OPTIONS.get(image_format, {}))
+    uploaded.close()
+    output.seek(0)
+    extension = EXTENSIONS.get(image_format, image_format.lower())
+    return File(output, name=f"{uuid.uuid4().hex}.{extension}")
+
+
+def store(job):
+    """Save the job's image and its variants on its target object.
+
+    Uploads are decoded and re-encoded first. Saving with ``update_fields``
+    fires the usual signals, which invalidate cached responses.
+    """
+    instance = get_target(job)
+    if instance is None:
+        return
+    update_fields = [variants_field(job.field_name)]
+    if job.kind == ImageJob.Kind.UPLOAD:
+        field = Base64ImageField(max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS)
+        image = reencode(field.to_internal_value(job.payload))
+        getattr(instance, job.field_name).save(image.name, image, save=False)
+        setattr(instance, status_field(job.field_name), ImageStatus.READY)
+        update_fields += [job.field_name, status_field(job.field_name)]
+    render_variants(instance, job.field_name)
+    instance.save(update_fields=update_fields)
+
+
+def fail(job, error, permanent=False):
+    """Schedule a retry with exponential backoff or dead-letter the job."""
+    if permanent or job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS:
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=ImageJob.Status.FAILED, locked_at=None, last_error=error
+        )
+        instance = get_target(job)
+        if instance is not None and job.kind == ImageJob.Kind.UPLOAD:
+            set_status(instance, job.field_name, ImageStatus.FAILED)
+        logger.error("Image job %s failed: %s", job.pk, error)
+        return
+    delay = settings.IMAGE_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+    ImageJob.objects.filter(pk=job.pk).update(
+        status=ImageJob.Status.PENDING,
+        locked_at=None,
+        available_at=timezone.now() + timedelta(seconds=delay),
+        last_error=error,
+    )
+
+
+def process(job):
+    try:
+        store(job)
+    except serializers.ValidationError as error:
+        fail(job, str(error.detail), permanent=True)
+    except Exception:
+        fail(job, traceback.format_exc())
+    else:
+        job.delete()
+
+
+def work(once=False, poll_interval=1.0):
+    """Process jobs until the queue is empty (``once``) or forever.
+
+    Returns the number of jobs handled.
+    """
+    handled = 0
+    while True:
+        job = claim()
+        if job is None:
+            if once:
+                return handled
+            close_old_connections()
+            time.sleep(poll_interval)
+            continue
+        process(job)
+        handled += 1
+
+
+def requeue(jobs):
+    """Move dead-lettered jobs back to the queue with fresh attempts."""
+    jobs = list(jobs.filter(status=ImageJob.Status.FAILED))
+    for job in jobs:
+        instance = get_target(job)
+        if instance is not None and job.kind == ImageJob.Kind.UPLOAD:
+            set_status(instance, job.field_name, ImageStatus.PENDING)
+    return ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+        status=ImageJob.Status.PENDING,
+        attempts=0,
+        available_at=timezone.now(),
+        last_error="",
+    )
+
+
+class DeferredImageMixin:
+    """Serializer mixin queueing ``PendingImage`` values after saving.
+
+    ``deferred_image_fields`` lists the deferrable ``Base64ImageField``
+    names handled this way.
+    """
+
+    deferred_image_fields = ()
+
+    def save(self, **kwargs):
+        pending = {
+            name: pop_pending(self.validated_data, name)
+            for name in self.deferred_image_fields
+        }
+        instance = super().save(**kwargs)
+        for name, image in pending.items():
+            if image is not None:
+                enqueue(instance, name, image)
+        return instance
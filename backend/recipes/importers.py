@@ -0,0 +1,125 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from . import ingredient_index, response_cache
+from .models import Ingredient
+
+FORMATS = ("csv", "json", "jsonl")
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def detect_format(path):
+    suffix = Path(path).suffix.lstrip(".").lower()
+    if suffix == "ndjson":
+        return "jsonl"
+    if suffix not in FORMATS:
+        raise ValueError(f"Unsupported ingredient file format: {path}")
+    return suffix
+
+
+def read_csv(file):
+    """Yield ``(name, measurement_unit)`` from rows, skipping a header row."""
+    for row in csv.reader(file):
+        if len(row) < 2 or row[:2] == ["name", "measurement_unit"]:
+            continue
+        yield row[0], row[1]
+
+
+def iter_json_array(file):
+    """Yield the items of a top-level JSON array without loading it at once."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    exhausted = False
+    while True:
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array of ingredients.")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+                break
+            yield item
+        buffer = buffer[position:]
+        if exhausted:
+            if buffer.strip() or not started:
+                raise ValueError("Unterminated JSON array of ingredients.")
+            return
+        chunk = file.read(READ_CHUNK_SIZE)
+        exhausted = not chunk
+        buffer += chunk
+
+
+def read_json(file):
+    for item in iter_json_array(file):
+        yield item["name"], item["measurement_unit"]
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item["name"], item["measurement_unit"]
+
+
+READERS = {"csv": read_csv, "json": read_json, "jsonl": read_jsonl}
+
+
+def read_ingredients(file, file_format):
+    """Yield stripped ``(name, measurement_unit)`` pairs from an open file."""
+    for name, measurement_unit in READERS[file_format](file):
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if name and measurement_unit:
+            yield name, measurement_unit
+
+
+def import_ingredients(rows, batch_size=1000, dry_run=False, progress=None):
+    """Insert the ingredients from ``rows`` that do not exist yet.
+
+    Rows are deduplicated in memory against each other and the existing
+    table and inserted with ``bulk_create(ignore_conflicts=True)`` in
+    batches, so running an import twice is harmless. ``progress`` is
+    called with the running stats after every batch.
+    """
+    existing = set(Ingredient.objects.values_list("name", "measurement_unit"))
+    stats = {"read": 0, "created": 0, "skipped": 0}
+    started = time.monotonic()
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        stats["read"] += len(batch)
+        new = []
+        for key in batch:
+            if key in existing:
+                stats["skipped"] += 1
+                continue
+            existing.add(key)
+            new.append(Ingredient(name=key[0], measurement_unit=key[1]))
+        if new and not dry_run:
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+        stats["created"] += len(new)
+        stats["seconds"] = time.monotonic() - started
+        if progress:
+            progress(stats)
+
+    stats["seconds"] = time.monotonic() - started
+    if stats["created"] and not dry_run:
+        # bulk_create sends no signals, so drop the caches explicitly.
+        ingredient_index.invalidate()
+        response_cache.invalidate_ingredients()
+    return stats
@@ -0,0 +1,114 @@
+import json
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+from core.cache import incr
+
+from .models import Ingredient
+
+GENERATION_CACHE_KEY = "recipes:ingredient_index:generation"
+
+_lock = threading.Lock()
+_index = None
+_generation = None
+
+
+def normalize(value):
+    """Fold case, Unicode forms and ё/е so that lookups match loosely."""
+    value = unicodedata.normalize("NFKC", value).casefold()
+    return value.replace("ё", "е")
+
+
+class IngredientIndex:
+    """Sorted-array prefix index over ingredient names.
+
+    Every ingredient is stored next to its normalized name and its JSON
+    encoding, so a lookup is two binary searches and a byte join.
+    """
+
+    def __init__(self, ingredients):
+        ingredients = list(ingredients)
+        entries = sorted(
+            (
+                normalize(name),
+                name,
+                json.dumps(
+                    {"id": pk, "name": name, "measurement_unit": unit},
+                    ensure_ascii=False,
+                ).encode(),
+            )
+            for pk, name, unit in ingredients
+        )
+        self._keys = [key for key, _, _ in entries]
+        self._payloads = [payload for _, _, payload in entries]
+        self.ids = frozenset(pk for pk, _, _ in ingredients)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix, limit=None):
+        """Return the encoded ingredients whose names start with ``prefix``."""
+        prefix = normalize(prefix)
+        start = bisect_left(self._keys, prefix)
+        if prefix:
+            end = bisect_left(self._keys, prefix + "\U0010ffff", start)
+        else:
+            end = len(self._keys)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self._payloads[start:end]
+
+    def search_json(self, prefix, limit=None):
+        return b"[" + b",".join(self.search(prefix, limit)) + b"]"
+
+
+def get_index():
+    """Return the worker's index, rebuilding it after an invalidation."""
+    global _index, _generation
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    if _index is None or _generation != generation:
+        with _lock:
+            if _index is None or _generation != generation:
+                metrics.CACHE_LOOKUPS.labels("ingredient_index", "miss").inc()
+                _index = IngredientIndex(
+                    Ingredient.objects.values_list(
+                        "id", "name", "measurement_unit"
+                    ).iterator()
+                )
+                _generation = generation
+                return _index
+    metrics.CACHE_LOOKUPS.labels("ingredient_index", "hit").inc()
+    return _index
+
+
+def existing_ids(ids):
+    """Return the members of ``ids`` that are ingredient ids.
+
+    Ids are resolved against this worker's index; only those it does not
+    know, e.g. ones created in another worker since it was built, are
+    looked up in the database.
+    """
+    ids = set(ids)
+    found = ids & get_index().ids if settings.INGREDIENT_SEARCH_INDEX else set()
+    missing = ids - found
+    if missing:
+        found.update(
+            Ingredient.objects.filter(id__in=missing).values_list("id", flat=True)
+        )
+    return found
+
+
+def invalidate():
+    """Drop this worker's index and tell the other workers to drop theirs.
+
+    Other workers only notice through the shared cache, so the default
+    per-process cache limits invalidation to the current worker.
+    """
+    global _index
+    _index = None
+    incr(GENERATION_CACHE_KEY)
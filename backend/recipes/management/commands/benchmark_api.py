@@ -0,0 +1,125 @@
+import logging
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from recipes import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures SQL query counts, p50/p95 latency and allocated memory of "
+        "the API endpoints on generated datasets in a throwaway test "
+        "database, and fails if query counts (or, with --check-timings, "
+        "latency and memory) regressed from the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="tiny,small",
+            help=f"Comma-separated dataset sizes: {', '.join(benchmarks.SIZES)}.",
+        )
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            dest="scenarios",
+            choices=benchmarks.SCENARIOS,
+            help="Only run the given scenario (can be repeated).",
+        )
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--ingredients-source",
+            help="Ingredient file for generate_load_data; data/ingredients.csv "
+            "is looked up by default.",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=benchmarks.BASELINE_PATH,
+            help="Baseline JSON to compare with.",
+        )
+        parser.add_argument(
+            "--check-timings",
+            action="store_true",
+            help="Also compare latency and memory; only meaningful against a "
+            "baseline recorded on the same machine and database engine.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Allowed relative growth of latency and memory.",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store the results as the new baseline instead of comparing.",
+        )
+        parser.add_argument("--output", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        sizes = options["sizes"].split(",")
+        unknown = set(sizes) - set(benchmarks.SIZES)
+        if unknown:
+            raise CommandError(f"Unknown sizes: {', '.join(sorted(unknown))}")
+
+        results = {}
+        # Generated data trips the slow request and N+1 warnings constantly.
+        profiling_logger = logging.getLogger("core.profiling")
+        profiling_logger.disabled = True
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root
+            ):
+                for size in sizes:
+                    self.stdout.write(f"Generating the {size} dataset...")
+                    benchmarks.generate(
+                        size, options["seed"], options["ingredients_source"]
+                    )
+                    results[size] = benchmarks.run(
+                        options["iterations"], options["scenarios"]
+                    )
+                    self.report(size, results[size])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            profiling_logger.disabled = False
+
+        if options["output"]:
+            benchmarks.save_baseline(results, options["output"])
+        if options["update_baseline"]:
+            baseline = benchmarks.load_baseline(options["baseline"])
+            baseline.update(results)
+            benchmarks.save_baseline(baseline, options["baseline"])
+            self.stdout.write(self.style.SUCCESS("Baseline updated."))
+            return
+
+        regressions = benchmarks.compare(
+            results,
+            benchmarks.load_baseline(options["baseline"]),
+            options["tolerance"] if options["check_timings"] else None,
+        )
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            raise CommandError(f"{len(regressions)} benchmark regressions.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def report(self, size, results):
+        self.stdout.write(
+            f"{'endpoint':<34}{'queries':>8}{'p50 ms':>10}{'p95 ms':>10}{'KB':>10}"
+        )
+        for name, metrics in results.items():
+            self.stdout.write(
+                f"{name:<34}{metrics['queries']:>8}{metrics['p50_ms']:>10.2f}"
+                f"{metrics['p95_ms']:>10.2f}{metrics['peak_kb']:>10.1f}"
+            )
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from recipes.filters import IngredientFilter
+from recipes.ingredient_index import IngredientIndex
+from recipes.models import Ingredient
+from recipes.serializers import IngredientSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ingredient autocomplete through the ORM with the in-process "
+        "prefix index on the ingredients currently in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prefix-length",
+            type=int,
+            default=2,
+            help="Length of the name prefixes to look up.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="How many times every prefix is looked up.",
+        )
+
+    def _orm_lookup(self, prefix):
+        queryset = IngredientFilter(
+            {"name": prefix}, queryset=Ingredient.objects.order_by("name")
+        ).qs
+        return JSONRenderer().render(IngredientSerializer(queryset, many=True).data)
+
+    def _measure(self, lookup, prefixes, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for prefix in prefixes:
+                lookup(prefix)
+        return (time.perf_counter() - started) / (len(prefixes) * repeat)
+
+    def handle(self, *args, **options):
+        length = options["prefix_length"]
+        prefixes = sorted(
+            {
+                name[:length]
+                for name in Ingredient.objects.values_list("name", flat=True)
+                if len(name) >= length
+            }
+        )
+        if not prefixes:
+            raise CommandError("No ingredients to benchmark against.")
+
+        started = time.perf_counter()
+        index = IngredientIndex(
+            Ingredient.objects.values_list("id", "name", "measurement_unit")
+        )
+        build_time = time.perf_counter() - started
+
+        orm_time = self._measure(self._orm_lookup, prefixes, options["repeat"])
+        index_time = self._measure(index.search_json, prefixes, options["repeat"])
+
+        self.stdout.write(
+            f"{len(index)} ingredients, {len(prefixes)} prefixes of length {length}"
+        )
+        self.stdout.write(f"index build: {build_time * 1000:.2f} ms")
+        self.stdout.write(f"ORM lookup:   {orm_time * 1000:.3f} ms per query")
+        self.stdout.write(f"index lookup: {index_time * 1000:.3f} ms per query")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {orm_time / index_time:.1f}x"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the canonical API queries and fails when a plan "
+        "reads a table without an index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--query",
+            action="append",
+            choices=query_plans.CANONICAL_QUERIES,
+            help="Only explain this query; may be repeated.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            results = query_plans.explain(options["query"])
+        except ValueError as error:
+            raise CommandError(error)
+        flagged = []
+        for name, (plan, tables) in results.items():
+            if tables:
+                flagged.append(f"{name}: {', '.join(tables)}")
+                self.stdout.write(self.style.WARNING(f"{name}: sequential scan"))
+            else:
+                self.stdout.write(f"{name}: ok")
+            if options["verbosity"] > 1 or tables:
+                self.stdout.write(plan)
+        if flagged:
+            raise CommandError(
+                "Sequential scans in canonical queries:\n" + "\n".join(flagged)
+            )
+        self.stdout.write(self.style.SUCCESS("Every canonical query uses an index."))
@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import thumbnails
+from core.workers import init_worker
+from recipes.models import Recipe
+
+User = get_user_model()
+
+TARGETS = [
+    (Recipe, "image", thumbnails.RECIPE_IMAGE_WIDTHS),
+    (User, "avatar", thumbnails.AVATAR_WIDTHS),
+]
+
+
+def generate(model_label, field_name, widths, pk, force):
+    instance = apps.get_model(model_label).objects.get(pk=pk)
+    return bool(thumbnails.update_variants(instance, field_name, widths, force))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the resized AVIF/WebP/JPEG variants of recipe images and "
+        "avatars that are missing or outdated, in parallel worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes; 1 runs in this process.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate variants that look up to date.",
+        )
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, field_name, widths in TARGETS:
+            objects = model.objects.exclude(**{field_name: ""}).exclude(
+                **{f"{field_name}__isnull": True}
+            )
+            for pk, name, variants in objects.values_list(
+                "pk", field_name, f"{field_name}_variants"
+            ).iterator():
+                if options["force"] or variants.get("source") != name:
+                    jobs.append(
+                        (model._meta.label, field_name, widths, pk, options["force"])
+                    )
+
+        if options["workers"] <= 1:
+            results = [generate(*job) for job in jobs]
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=init_worker
+            ) as executor:
+                results = list(executor.map(generate, *zip(*jobs)) if jobs else [])
+
+        generated = sum(results)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated variants for {generated} of {len(jobs)} images."
+            )
+        )
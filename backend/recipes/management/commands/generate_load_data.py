@@ -0,0 +1,278 @@
+import random
+import time
+from io import BytesIO
+from itertools import accumulate
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from recipes import importers, response_cache, search
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+)
+
+User = get_user_model()
+
+DATA_DIR = Path("/data")
+# Image shared by all generated recipes.
+PLACEHOLDER_IMAGE = "recipes/generated.png"
+
+SCALES = {
+    "small": {
+        "users": 1_000,
+        "recipes": 10_000,
+        "favorites": 50_000,
+        "carts": 10_000,
+        "subscriptions": 20_000,
+    },
+    "medium": {
+        "users": 10_000,
+        "recipes": 100_000,
+        "favorites": 500_000,
+        "carts": 100_000,
+        "subscriptions": 200_000,
+    },
+    "large": {
+        "users": 100_000,
+        "recipes": 1_000_000,
+        "favorites": 5_000_000,
+        "carts": 1_000_000,
+        "subscriptions": 2_000_000,
+    },
+}
+
+
+class ZipfSampler:
+    """Draw items so that the k-th most popular one has weight 1 / k**s.
+
+    The popularity order is a seeded shuffle, so popular rows are spread
+    over the id range instead of being the oldest ones.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(
+            accumulate(1 / rank**exponent for rank in range(1, len(self.items) + 1))
+        )
+        self.rng = rng
+
+    def sample(self, count):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=count)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a reproducible synthetic dataset for benchmarking: users, "
+        "recipes, and Zipf-distributed favorites, carts and subscriptions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            choices=SCALES,
+            default="small",
+            help="Preset row counts; the options below override them.",
+        )
+        for name in SCALES["small"]:
+            parser.add_argument(f"--{name}", type=int, help=f"Number of {name}.")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+        parser.add_argument(
+            "--zipf-exponent",
+            type=float,
+            default=1.1,
+            help="Skew of recipe, author and ingredient popularity.",
+        )
+        parser.add_argument(
+            "--ingredients-per-recipe",
+            type=int,
+            nargs=2,
+            default=(3, 12),
+            metavar=("MIN", "MAX"),
+        )
+        parser.add_argument(
+            "--ingredients-source",
+            type=Path,
+            default=DATA_DIR / "ingredients.csv",
+            help="Ingredient file imported when the table is empty.",
+        )
+        parser.add_argument(
+            "--prefix",
+            default="load",
+            help="Prefix of the generated usernames and emails.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        counts = {
+            name: default if options[name] is None else options[name]
+            for name, default in SCALES[options["scale"]].items()
+        }
+        self.batch_size = options["batch_size"]
+        self.rng = random.Random(options["seed"])
+        self.exponent = options["zipf_exponent"]
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(
+                f"Users prefixed '{prefix}_' already exist; pass another --prefix."
+            )
+
+        ingredient_ids = self.ensure_ingredients(options["ingredients_source"])
+        user_ids = self.timed("users", self.create_users, prefix, counts["users"])
+        recipe_ids = self.timed(
+            "recipes",
+            self.create_recipes,
+            user_ids,
+            ingredient_ids,
+            counts["recipes"],
+            options["ingredients_per_recipe"],
+        )
+        recipes = ZipfSampler(recipe_ids, self.exponent, self.rng)
+        self.timed(
+            "favorites",
+            self.create_pairs,
+            Favorite,
+            recipes,
+            user_ids,
+            counts["favorites"],
+        )
+        self.timed(
+            "carts",
+            self.create_pairs,
+            ShoppingCart,
+            recipes,
+            user_ids,
+            counts["carts"],
+        )
+        self.timed(
+            "subscriptions",
+            self.create_subscriptions,
+            user_ids,
+            counts["subscriptions"],
+        )
+
+        # Bulk inserts bypass the signals that keep denormalized data current.
+        self.timed("counters", call_command, "reconcile_counters", stdout=self.stdout)
+        self.timed(
+            "shopping lists", call_command, "rebuild_shopping_lists", stdout=self.stdout
+        )
+        self.timed("feeds", call_command, "rebuild_feeds", stdout=self.stdout)
+        self.timed(
+            "search vectors",
+            search.update_search_vectors,
+            Recipe.objects.filter(author__username__startswith=f"{prefix}_"),
+        )
+        response_cache.invalidate_recipes([])
+        self.stdout.write(self.style.SUCCESS("Synthetic dataset generated."))
+
+    def timed(self, label, function, *args, **kwargs):
+        started = time.monotonic()
+        result = function(*args, **kwargs)
+        self.stdout.write(f"{label}: {time.monotonic() - started:.1f}s")
+        return result
+
+    def ensure_ingredients(self, source):
+        if not Ingredient.objects.exists():
+            with open(source, encoding="utf-8", newline="") as f:
+                importers.import_ingredients(
+                    importers.read_ingredients(f, importers.detect_format(source))
+                )
+        ingredients = list(Ingredient.objects.values_list("id", "name"))
+        if not ingredients:
+            raise CommandError("No ingredients to build recipes from.")
+        self.ingredient_names = dict(ingredients)
+        return list(self.ingredient_names)
+
+    def create_users(self, prefix, count):
+        password = make_password("TestPassword123")
+        user_ids = []
+        for start in range(0, count, self.batch_size):
+            users = User.objects.bulk_create(
+                User(
+                    username=f"{prefix}_{i}",
+                    email=f"{prefix}_{i}@example.com",
+                    first_name="Load",
+                    last_name=f"User{i}",
+                    password=password,
+                )
+                for i in range(start, min(start + self.batch_size, count))
+            )
+            user_ids.extend(user.pk for user in users)
+        return user_ids
+
+    def create_recipes(self, user_ids, ingredient_ids, count, ingredients_range):
+        if not default_storage.exists(PLACEHOLDER_IMAGE):
+            buffer = BytesIO()
+            Image.new("RGB", (640, 480), "lightgray").save(buffer, "PNG")
+            default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+        authors = ZipfSampler(user_ids, self.exponent, self.rng)
+        ingredients = ZipfSampler(ingredient_ids, self.exponent, self.rng)
+        recipe_ids = []
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            compositions = [
+                set(ingredients.sample(self.rng.randint(*ingredients_range)))
+                for _ in range(size)
+            ]
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=author_id,
+                    name=" и ".join(
+                        self.ingredient_names[i] for i in sorted(composition)[:2]
+                    )[:200],
+                    image=PLACEHOLDER_IMAGE,
+                    text=", ".join(
+                        self.ingredient_names[i] for i in sorted(composition)
+                    ),
+                    cooking_time=self.rng.randint(5, 180),
+                )
+                for author_id, composition in zip(authors.sample(size), compositions)
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500),
+                )
+                for recipe, composition in zip(recipes, compositions)
+                for ingredient_id in sorted(composition)
+            )
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+        return recipe_ids
+
+    def bulk_create_pairs(self, model, field, targets, user_ids, count):
+        """Insert ``count`` (uniform user, Zipf target) pairs, skipping repeats."""
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            pairs = {
+                (user_id, target_id)
+                for user_id, target_id in zip(
+                    self.rng.choices(user_ids, k=size), targets.sample(size)
+                )
+                if user_id != target_id or field != "author_id"
+            }
+            model.objects.bulk_create(
+                (
+                    model(user_id=user_id, **{field: target_id})
+                    for user_id, target_id in sorted(pairs)
+                ),
+                ignore_conflicts=True,
+            )
+
+    def create_pairs(self, model, recipes, user_ids, count):
+        self.bulk_create_pairs(model, "recipe_id", recipes, user_ids, count)
+
+    def create_subscriptions(self, user_ids, count):
+        authors = ZipfSampler(user_ids, self.exponent, self.rng)
+        self.bulk_create_pairs(Subscription, "author_id", authors, user_ids, count)
@@ -1,7 +1,7 @@
-import json
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from recipes import importers
 from recipes.models import Ingredient, Recipe, RecipeIngredient
 
 User = get_user_model()
@@ -14,42 +14,74 @@ class Command(BaseCommand):
         "Loads initial data for the Foodgram project: ingredients, users, recipes, etc."
     )
 
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS("Starting data loading process..."))
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            type=Path,
+            default=DATA_DIR / "ingredients.csv",
+            help="Ingredient file (.csv, .json or .jsonl) to import.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=importers.FORMATS,
+            help="Format of --source; detected from the extension by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of ingredients inserted per query.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be imported; sample data is skipped.",
+        )
 
+    def load_ingredients(self, options):
+        source = options["source"]
+        self.stdout.write(
+            self.style.NOTICE(f"Attempting to load ingredients from: {source}")
+        )
         try:
-            ingredients_file_path = DATA_DIR / "ingredients.json"
-            self.stdout.write(
-                self.style.NOTICE(
-                    f"Attempting to load ingredients from: {ingredients_file_path}"
-                )
-            )
-            with open(ingredients_file_path, "r", encoding="utf-8") as f:
-                ingredients_data = json.load(f)
-
-            loaded_count = 0
-            skipped_count = 0
-            for item in ingredients_data:
-                _, created = Ingredient.objects.get_or_create(
-                    name=item["name"], measurement_unit=item["measurement_unit"]
-                )
-                if created:
-                    loaded_count += 1
-                else:
-                    skipped_count += 1
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"{loaded_count} new ingredients loaded, {skipped_count} already existed."
+            file_format = options["format"] or importers.detect_format(source)
+            with open(source, "r", encoding="utf-8", newline="") as f:
+                stats = importers.import_ingredients(
+                    importers.read_ingredients(f, file_format),
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"],
+                    progress=self.report_progress,
                 )
-            )
         except FileNotFoundError:
             self.stdout.write(
-                self.style.ERROR(
-                    f"{ingredients_file_path} not found. Skipping ingredients."
-                )
+                self.style.ERROR(f"{source} not found. Skipping ingredients.")
             )
-        except Exception as e:
+            return
+        except (ValueError, KeyError) as e:
             self.stdout.write(self.style.ERROR(f"Error loading ingredients: {e}"))
+            return
+
+        verb = "would be loaded" if options["dry_run"] else "loaded"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stats['created']} new ingredients {verb}, "
+                f"{stats['skipped']} already existed or were duplicated "
+                f"({stats['read']} rows in {stats['seconds']:.2f}s)."
+            )
+        )
+
+    def report_progress(self, stats):
+        rate = stats["read"] / stats["seconds"] if stats["seconds"] else 0
+        self.stdout.write(
+            f"  {stats['read']} rows read, {stats['created']} new ({rate:.0f} rows/s)"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Starting data loading process..."))
+
+        self.load_ingredients(options)
+        if options["dry_run"]:
+            return
 
         users_data = [
             {
@@ -100,9 +132,7 @@ class Command(BaseCommand):
             self.style.SUCCESS(f"{users_created_count} new users created/updated.")
         )
 
-        if (
-            Ingredient.objects.count() < 3
-        ):
+        if Ingredient.objects.count() < 3:
             self.stdout.write(
                 self.style.WARNING(
                     "Not enough ingredients to create sample recipes. Please load ingredients first."
@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.workers import init_worker
+from recipes import image_queue
+from recipes.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs worker processes that decode, re-encode and thumbnail uploaded "
+        "images queued while IMAGE_PROCESSING_ASYNC is on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of worker processes; 1 runs in this process.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no job is due instead of polling forever.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls of an empty queue.",
+        )
+        parser.add_argument(
+            "--requeue-failed",
+            action="store_true",
+            help="Move dead-lettered jobs back to the queue before starting.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue_failed"]:
+            count = image_queue.requeue(ImageJob.objects.all())
+            self.stdout.write(f"Requeued {count} failed jobs.")
+
+        args = (options["once"], options["poll_interval"])
+        if options["workers"] <= 1:
+            handled = image_queue.work(*args)
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=init_worker
+            ) as executor:
+                futures = [
+                    executor.submit(image_queue.work, *args)
+                    for _ in range(options["workers"])
+                ]
+                handled = sum(future.result() for future in futures)
+
+        failed = ImageJob.objects.filter(status=ImageJob.Status.FAILED).count()
+        self.stdout.write(
+            self.style.SUCCESS(f"Processed {handled} jobs, {failed} dead-lettered.")
+        )
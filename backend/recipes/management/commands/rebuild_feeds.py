@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = (
+        "Refills the subscription feeds from the subscriptions, e.g. after "
+        "bulk imports or a change of FEED_FANOUT_MAX_SUBSCRIBERS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Limit to the given user id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        count = feed.rebuild(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"{count} feed entries rebuilt."))
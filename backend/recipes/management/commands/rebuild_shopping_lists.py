@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the materialized shopping lists from the shopping carts, "
+        "or compares them with the live aggregate when --check is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report differences, exit with an error if there are any.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Limit to the given user id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not options["check"]:
+            count = shopping_list.rebuild(user_ids)
+            self.stdout.write(
+                self.style.SUCCESS(f"{count} shopping list items rebuilt.")
+            )
+            return
+
+        live = shopping_list.live_totals(user_ids)
+        stored = shopping_list.stored_totals(user_ids)
+        mismatches = 0
+        for key in sorted(live.keys() | stored.keys()):
+            expected, actual = live.get(key), stored.get(key)
+            if expected != actual:
+                mismatches += 1
+                user_id, ingredient_id = key
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"user {user_id}, ingredient {ingredient_id}: "
+                        f"expected {expected}, stored {actual}"
+                    )
+                )
+        if mismatches:
+            raise CommandError(
+                f"{mismatches} shopping list items differ from the live aggregate."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(live)} shopping list items are consistent.")
+        )
@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    """Correlated subquery counting ``model`` rows pointing at the outer row."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+COUNTERS = [
+    (Recipe, "favorites_count", count_of(Favorite, "recipe")),
+    (Recipe, "shopping_cart_count", count_of(ShoppingCart, "recipe")),
+    (User, "recipes_count", count_of(Recipe, "author")),
+    (User, "subscribers_count", count_of(Subscription, "author")),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the denormalized favorite, shopping cart, recipe and "
+        "subscriber counters, or only reports drift when --check is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report counters that drifted, exit with an error if any.",
+        )
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        with transaction.atomic():
+            for model, field, expression in COUNTERS:
+                drifted = model.objects.annotate(actual=expression).filter(
+                    ~Q(**{field: F("actual")})
+                )
+                count = drifted.count()
+                drifted_total += count
+                label = f"{model._meta.model_name}.{field}"
+                if count and not options["check"]:
+                    model.objects.filter(pk__in=drifted.values("pk")).update(
+                        **{field: expression}
+                    )
+                self.stdout.write(f"{label}: {count} rows drifted")
+
+        if options["check"] and drifted_total:
+            raise CommandError(f"{drifted_total} counters differ from the data.")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:10
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+from recipes.search import search_vector_expression
+
+INDEX_NAME = "recipes_recipe_search_vector_gin"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX {INDEX_NAME} ON recipes_recipe USING gin (search_vector)"
+    )
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.update(
+        search_vector=search_vector_expression(
+            apps.get_model("recipes", "RecipeIngredient"),
+            apps.get_model(settings.AUTH_USER_MODEL),
+        )
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0004_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
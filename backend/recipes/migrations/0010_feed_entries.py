@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def fill_feeds(apps, schema_editor):
+    """Copy the latest recipes of followed authors, as ``feed.rebuild`` does."""
+    FeedEntry = apps.get_model("recipes", "FeedEntry")
+    Recipe = apps.get_model("recipes", "Recipe")
+    Subscription = apps.get_model("recipes", "Subscription")
+    recent = (
+        Recipe.objects.filter(
+            author__subscribers_count__lte=settings.FEED_FANOUT_MAX_SUBSCRIBERS
+        )
+        .annotate(
+            author_rank=Window(
+                RowNumber(),
+                partition_by=F("author_id"),
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        )
+        .filter(author_rank__lte=settings.FEED_BACKFILL_SIZE)
+        .values_list("author_id", "id", "pub_date")
+    )
+    by_author = {}
+    for author_id, recipe_id, pub_date in recent.iterator():
+        by_author.setdefault(author_id, []).append((recipe_id, pub_date))
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, author_id in Subscription.objects.values_list(
+                "user_id", "author_id"
+            ).iterator()
+            for recipe_id, pub_date in by_author.get(author_id, ())
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_query_pattern_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pub_date", models.DateTimeField()),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to="recipes.recipe",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-pub_date", "-recipe"],
+                        name="feed_entry_user_idx",
+                    )
+                ],
+                "unique_together": {("user", "recipe")},
+            },
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
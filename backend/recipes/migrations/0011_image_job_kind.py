@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0010_feed_entries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imagejob",
+            name="kind",
+            field=models.CharField(
+                choices=[("upload", "Upload"), ("variants", "Variants")],
+                default="upload",
+                max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="imagejob",
+            name="payload",
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -1,5 +1,15 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Value, Window
+from django.db.models.functions import RowNumber
 from django.conf import settings
+from django.utils import timezone
+
+
+class ImageStatus(models.TextChoices):
+    READY = "ready"
+    PENDING = "pending"
+    FAILED = "failed"
 
 
 class Ingredient(models.Model):
@@ -14,32 +24,119 @@ class Ingredient(models.Model):
         return f"{self.name} ({self.measurement_unit})"
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_ingredients(self):
+        return self.prefetch_related(
+            Prefetch(
+                "recipeingredient_set",
+                queryset=RecipeIngredient.objects.select_related("ingredient"),
+            )
+        )
+
+    def with_user_flags(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_author_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef("author"))
+            ),
+        )
+
+    def latest_per_author(self, limit=None):
+        """Order by author, newest first, keeping ``limit`` recipes each."""
+        queryset = self.order_by("author_id", "-pub_date", "-id")
+        if limit is None:
+            return queryset
+        return queryset.annotate(
+            author_rank=Window(
+                RowNumber(),
+                partition_by=F("author_id"),
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        ).filter(author_rank__lte=limit)
+
+    def for_listing(self, user):
+        """Load a page of recipes in a fixed number of queries."""
+        return (
+            self.select_related("author")
+            .defer("search_vector")
+            .with_ingredients()
+            .with_user_flags(user)
+        )
+
+
 class Recipe(models.Model):
+    # Indexed by recipe_author_feed_idx.
     author = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="recipes"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="recipes",
+        db_index=False,
     )
     name = models.CharField(max_length=200)
     image = models.ImageField(upload_to="recipes/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_status = models.CharField(
+        max_length=10,
+        choices=ImageStatus.choices,
+        default=ImageStatus.READY,
+        editable=False,
+    )
     text = models.TextField()
     cooking_time = models.PositiveIntegerField()
     ingredients = models.ManyToManyField(
         Ingredient, through="RecipeIngredient", related_name="recipes"
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    shopping_cart_count = models.PositiveIntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-pub_date", "-id"], name="recipe_feed_idx"),
+            models.Index(
+                fields=["author", "-pub_date", "-id"], name="recipe_author_feed_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
 class RecipeIngredient(models.Model):
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    # Indexed by recipe_ingredient_unique.
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
     amount = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "ingredient"], name="recipe_ingredient_unique"
+            ),
+        ]
+
 
 class Subscription(models.Model):
+    # Indexed by the unique (user, author) index.
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="subscriptions"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="subscriptions",
+        db_index=False,
     )
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="subscribers"
@@ -47,11 +144,18 @@ class Subscription(models.Model):
 
     class Meta:
         unique_together = ("user", "author")
+        indexes = [
+            models.Index(fields=["user", "-id"], name="subscription_feed_idx"),
+        ]
 
 
 class Favorite(models.Model):
+    # Indexed by the unique (user, recipe) index.
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="favorites"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="favorites",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name="favorited_by"
@@ -62,8 +166,12 @@ class Favorite(models.Model):
 
 
 class ShoppingCart(models.Model):
+    # Indexed by the unique (user, recipe) index.
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="shopping_cart"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE, related_name="in_shopping_carts"
@@ -71,3 +179,101 @@ class ShoppingCart(models.Model):
 
     class Meta:
         unique_together = ("user", "recipe")
+
+
+class ShoppingListItem(models.Model):
+    """Running total of an ingredient across a user's shopping cart.
+
+    Kept in sync incrementally by ``recipes.shopping_list`` so that reading
+    a shopping list does not need to aggregate ``RecipeIngredient`` rows.
+    """
+
+    # Indexed by the unique (user, ingredient) index.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name="shopping_list_items"
+    )
+    total_amount = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("user", "ingredient")
+
+
+class FeedEntry(models.Model):
+    """Recipe in the feed of a user subscribed to its author.
+
+    Written by ``recipes.feed`` when a recipe is published or a user
+    subscribes, so that reading a feed is a range scan of one index;
+    ``pub_date`` is copied from the recipe for that.
+    """
+
+    # Indexed by feed_entry_user_idx and the unique (user, recipe) index.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "recipe")
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"], name="feed_entry_user_idx"
+            ),
+        ]
+
+
+class ImageJob(models.Model):
+    """Image work waiting to be processed by ``process_image_jobs``.
+
+    ``upload`` jobs keep the raw data URI until a worker has decoded and
+    stored it; ``variants`` jobs render the resized copies of an image
+    already stored. Jobs are deleted on success and kept as ``failed`` once
+    they run out of attempts or the upload turns out to be invalid.
+    """
+
+    class Kind(models.TextChoices):
+        UPLOAD = "upload"
+        VARIANTS = "variants"
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSING = "processing"
+        FAILED = "failed"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.UPLOAD)
+    model_label = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=50)
+    payload = models.TextField(blank=True)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Dead-lettered jobs are never claimed, so they stay out of it.
+            models.Index(
+                fields=["status", "available_at"],
+                condition=~Q(status="failed"),
+                name="imagejob_queue_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label}#{self.object_id}.{self.field_name}"
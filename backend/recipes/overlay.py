@@ -0,0 +1,110 @@
+import copy
+
+from django.conf import settings
+from django.db.models import Value
+
+from . import response_cache
+from .models import Favorite, Recipe, ShoppingCart, Subscription
+from .serializers import RecipeListSerializer
+
+
+def body_key(origin, recipe_id, generation, ingredients_generation):
+    digest = response_cache.origin_digest(origin)
+    return (
+        f"{response_cache.KEY_PREFIX}:body:{recipe_id}:"
+        f"{generation or 0}.{ingredients_generation or 0}:{digest}"
+    )
+
+
+def get_bodies(request, recipe_ids):
+    """Return the shared (non-personalized) payloads of the given recipes.
+
+    Payloads are cached per recipe under the recipe's generation, so they
+    are invalidated by the same signals as the anonymous response cache.
+    """
+    cache = response_cache.get_cache()
+    generation_keys = {
+        recipe_id: response_cache.recipe_generation_key(recipe_id)
+        for recipe_id in recipe_ids
+    }
+    generations = cache.get_many(
+        [*generation_keys.values(), response_cache.INGREDIENTS_GENERATION]
+    )
+    origin = request.build_absolute_uri("/")
+    keys = {
+        recipe_id: body_key(
+            origin,
+            recipe_id,
+            generations.get(generation_keys[recipe_id]),
+            generations.get(response_cache.INGREDIENTS_GENERATION),
+        )
+        for recipe_id in recipe_ids
+    }
+    cached = cache.get_many(keys.values())
+    bodies = {
+        recipe_id: cached[key] for recipe_id, key in keys.items() if key in cached
+    }
+
+    missing = [recipe_id for recipe_id in recipe_ids if recipe_id not in bodies]
+    if missing:
+        recipes = Recipe.objects.filter(pk__in=missing).for_listing(None)
+        serializer = RecipeListSerializer(
+            recipes, many=True, context={"request": request}
+        )
+        fresh = {item["id"]: dict(item) for item in serializer.data}
+        cache.set_many(
+            {keys[recipe_id]: body for recipe_id, body in fresh.items()},
+            settings.RECIPES_CACHE_TIMEOUT,
+        )
+        bodies.update(fresh)
+    return bodies
+
+
+def get_user_flags(user, recipe_ids, author_ids):
+    """Load which of the recipes and authors the user has marked.
+
+    All three relations are read with a single UNION ALL query restricted
+    to the given ids, so the cost does not grow with the user's history.
+    """
+    favorites = (
+        Favorite.objects.filter(user=user, recipe_id__in=recipe_ids)
+        .annotate(kind=Value("favorite"))
+        .values_list("kind", "recipe_id")
+    )
+    cart = (
+        ShoppingCart.objects.filter(user=user, recipe_id__in=recipe_ids)
+        .annotate(kind=Value("cart"))
+        .values_list("kind", "recipe_id")
+    )
+    subscriptions = (
+        Subscription.objects.filter(user=user, author_id__in=author_ids)
+        .annotate(kind=Value("subscription"))
+        .values_list("kind", "author_id")
+    )
+    flags = {"favorite": set(), "cart": set(), "subscription": set()}
+    for kind, object_id in favorites.union(cart, subscriptions, all=True):
+        flags[kind].add(object_id)
+    return flags
+
+
+def personalize(request, recipe_ids):
+    """Build the list payload for an authenticated user.
+
+    The shared body of every recipe is copied and the per-user booleans
+    (``is_favorited``, ``is_in_shopping_cart`` and ``author.is_subscribed``)
+    are overlaid on top.
+    """
+    bodies = get_bodies(request, recipe_ids)
+    author_ids = {body["author"]["id"] for body in bodies.values()}
+    flags = get_user_flags(request.user, recipe_ids, author_ids)
+    data = []
+    for recipe_id in recipe_ids:
+        if recipe_id not in bodies:
+            continue
+        body = copy.copy(bodies[recipe_id])
+        body["author"] = dict(body["author"])
+        body["is_favorited"] = recipe_id in flags["favorite"]
+        body["is_in_shopping_cart"] = recipe_id in flags["cart"]
+        body["author"]["is_subscribed"] = body["author"]["id"] in flags["subscription"]
+        data.append(body)
+    return data
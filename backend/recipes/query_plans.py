@@ -0,0 +1,119 @@
+import re
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .image_queue import due_jobs
+from .models import (
+    Favorite,
+    FeedEntry,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Subscription,
+)
+
+User = get_user_model()
+
+PAGE_SIZE = 12
+FEED_ORDER = ("-pub_date", "-id")
+
+# Plan lines reading a whole table instead of going through an index.
+SEQUENTIAL_SCAN_RES = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (\w+)\b(?! USING)"),
+}
+
+
+def get_context():
+    """Ids to run the queries with; any value gives the same plan shape."""
+    return {
+        "user": User.objects.values_list("pk", flat=True).first() or 0,
+        "author": Recipe.objects.values_list("author_id", flat=True).first() or 0,
+        "recipe": Recipe.objects.values_list("pk", flat=True).first() or 0,
+    }
+
+
+# The queries behind the hot endpoints, as the views and signals build them.
+CANONICAL_QUERIES = {
+    "recipes-feed": lambda ctx: Recipe.objects.order_by(*FEED_ORDER)[:PAGE_SIZE],
+    "recipes-by-author": lambda ctx: Recipe.objects.filter(
+        author_id=ctx["author"]
+    ).order_by(*FEED_ORDER)[:PAGE_SIZE],
+    "recipes-favorited": lambda ctx: Recipe.objects.filter(
+        favorited_by__user_id=ctx["user"]
+    ).order_by(*FEED_ORDER)[:PAGE_SIZE],
+    "recipes-in-cart": lambda ctx: Recipe.objects.filter(
+        in_shopping_carts__user_id=ctx["user"]
+    ).order_by(*FEED_ORDER)[:PAGE_SIZE],
+    "recipe-user-flags": lambda ctx: Recipe.objects.filter(
+        pk=ctx["recipe"]
+    ).with_user_flags(User(pk=ctx["user"])),
+    "recipe-ingredients": lambda ctx: RecipeIngredient.objects.filter(
+        recipe_id=ctx["recipe"]
+    ).values_list("ingredient_id", "amount"),
+    "recipe-favorites": lambda ctx: Favorite.objects.filter(recipe_id=ctx["recipe"]),
+    "recipe-carts": lambda ctx: ShoppingCart.objects.filter(
+        recipe_id=ctx["recipe"]
+    ).values_list("user_id", flat=True),
+    "author-subscribers": lambda ctx: Subscription.objects.filter(
+        author_id=ctx["author"]
+    ),
+    "user-subscriptions": lambda ctx: Subscription.objects.filter(
+        user_id=ctx["user"]
+    ).order_by("-id")[:6],
+    "user-feed": lambda ctx: FeedEntry.objects.filter(user_id=ctx["user"])
+    .order_by("-pub_date", "-recipe_id")
+    .values_list("pub_date", "recipe_id")[:PAGE_SIZE],
+    "shopping-list": lambda ctx: ShoppingListItem.objects.filter(user_id=ctx["user"])
+    .values("total_amount", name=F("ingredient__name"))
+    .order_by("name"),
+    "image-queue": lambda ctx: due_jobs(timezone.now())[:1],
+}
+
+
+def sequential_scans(plan, vendor=None):
+    """Return the tables ``plan`` reads without an index."""
+    pattern = SEQUENTIAL_SCAN_RES[vendor or connection.vendor]
+    return sorted(set(pattern.findall(plan)))
+
+
+@contextmanager
+def prefer_indexes():
+    """Make PostgreSQL pick any usable index, however small the table.
+
+    With sequential scans priced out, one left in a plan means no index
+    fits the query.
+    """
+    if connection.vendor != "postgresql":
+        yield
+        return
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        yield
+
+
+def explain(names=None):
+    """Return ``{name: (plan, tables scanned sequentially)}``.
+
+    Raises ``ValueError`` for databases whose plans cannot be checked.
+    """
+    if connection.vendor not in SEQUENTIAL_SCAN_RES:
+        raise ValueError(
+            f"Query plans of {connection.vendor} cannot be checked; supported "
+            f"databases: {', '.join(SEQUENTIAL_SCAN_RES)}."
+        )
+    ctx = get_context()
+    results = {}
+    with prefer_indexes():
+        for name, build in CANONICAL_QUERIES.items():
+            if names and name not in names:
+                continue
+            plan = build(ctx).explain()
+            results[name] = (plan, sequential_scans(plan))
+    return results
@@ -0,0 +1,136 @@
+import csv
+import json
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """File-like object that hands back whatever is written to it."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Base class for shopping list formats.
+
+    Subclasses define ``stream``, which turns an iterator of aggregated rows
+    (dicts with ``name``, ``measurement_unit`` and ``total_amount``) into an
+    iterator of chunks for a ``StreamingHttpResponse``. ``render`` is only
+    used for error payloads.
+    """
+
+    charset = "utf-8"
+    extension = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def format_line(self, row):
+        return f"- {row['name']} ({row['measurement_unit']}): {row['total_amount']}"
+
+    def get_filename(self):
+        return f"shopping_list.{self.extension}"
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = "text/plain"
+    format = "txt"
+    extension = "txt"
+
+    def stream(self, rows):
+        yield "Список покупок:\n\n"
+        for row in rows:
+            yield self.format_line(row) + "\n"
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    extension = "csv"
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(["name", "measurement_unit", "total_amount"])
+        for row in rows:
+            yield writer.writerow(
+                [row["name"], row["measurement_unit"], row["total_amount"]]
+            )
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = "application/json"
+    format = "json"
+    extension = "json"
+
+    def stream(self, rows):
+        separator = "["
+        for row in rows:
+            yield separator + json.dumps(row, ensure_ascii=False)
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """Lay the list out with reportlab.
+
+    A PDF needs its cross-reference table at the end, so the document is
+    built into a spooled temporary file and then streamed in chunks.
+    """
+
+    media_type = "application/pdf"
+    format = "pdf"
+    extension = "pdf"
+    charset = None
+    font_name = "ShoppingListFont"
+    font_size = 12
+    margin = 50
+
+    def _register_font(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+
+    def stream(self, rows):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        self._register_font()
+        with SpooledTemporaryFile(max_size=STREAM_CHUNK_SIZE * 16) as buffer:
+            pdf = canvas.Canvas(buffer, pagesize=A4)
+            width, height = A4
+            line_height = self.font_size * 1.5
+            y = height - self.margin
+            pdf.setFont(self.font_name, self.font_size + 4)
+            pdf.drawString(self.margin, y, "Список покупок")
+            y -= line_height * 2
+            pdf.setFont(self.font_name, self.font_size)
+            for row in rows:
+                if y < self.margin:
+                    pdf.showPage()
+                    pdf.setFont(self.font_name, self.font_size)
+                    y = height - self.margin
+                pdf.drawString(self.margin, y, self.format_line(row))
+                y -= line_height
+            pdf.save()
+            buffer.seek(0)
+            while chunk := buffer.read(STREAM_CHUNK_SIZE):
+                yield chunk
+
+
+SHOPPING_LIST_RENDERERS = [
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListJSONRenderer,
+    ShoppingListPDFRenderer,
+]
@@ -0,0 +1,126 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from core import metrics
+from core.cache import incr
+
+KEY_PREFIX = "recipes:response"
+LIST_GENERATION = f"{KEY_PREFIX}:generation:list"
+INGREDIENTS_GENERATION = f"{KEY_PREFIX}:generation:ingredients"
+HITS = f"{KEY_PREFIX}:hits"
+MISSES = f"{KEY_PREFIX}:misses"
+
+# Filters that only apply to authenticated users and so never change the
+# anonymous representation.
+IGNORED_PARAMS = {"is_favorited", "is_in_shopping_cart"}
+
+
+def get_cache():
+    return caches[settings.RECIPES_CACHE_ALIAS]
+
+
+def recipe_generation_key(recipe_id):
+    return f"{KEY_PREFIX}:generation:recipe:{recipe_id}"
+
+
+def normalize_query(query_params):
+    """Sorted, de-duplicated query string without no-op parameters."""
+    items = sorted(
+        (key, value)
+        for key, values in query_params.lists()
+        if key not in IGNORED_PARAMS
+        for value in set(values)
+        if value != ""
+    )
+    return urlencode(items)
+
+
+def origin_digest(origin):
+    return hashlib.md5(origin.encode(), usedforsecurity=False).hexdigest()
+
+
+def make_key(request, generations, *parts):
+    # Image URLs are absolute, so the origin is part of the representation.
+    origin = request.build_absolute_uri("/")
+    query = normalize_query(request.query_params)
+    digest = hashlib.md5(
+        f"{origin} {request.accepted_media_type}?{query}".encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    versions = ".".join(str(value or 0) for value in generations)
+    return ":".join([KEY_PREFIX, *map(str, parts), versions, digest])
+
+
+def cached_response(request, key_parts, generation_keys, build_response):
+    """Return the anonymous response for the request, building it on a miss.
+
+    Only the serialized ``data`` of successful responses is stored; it is
+    addressed by the current values of ``generation_keys``, so bumping any
+    of them makes the old entries unreachable.
+    """
+    cache = get_cache()
+    generations = cache.get_many(generation_keys)
+    key = make_key(
+        request, [generations.get(name) for name in generation_keys], *key_parts
+    )
+    data = cache.get(key)
+    if data is not None:
+        incr(HITS, cache)
+        metrics.CACHE_LOOKUPS.labels("responses", "hit").inc()
+        response = Response(data)
+        response["X-Cache"] = "HIT"
+        return response
+
+    incr(MISSES, cache)
+    metrics.CACHE_LOOKUPS.labels("responses", "miss").inc()
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RECIPES_CACHE_TIMEOUT)
+    response["X-Cache"] = "MISS"
+    return response
+
+
+def bump(generation_keys):
+    """Increment ``generation_keys`` once the current transaction commits.
+
+    Bumping earlier would let a concurrent read cache the old rows under
+    the new generation, where they would stay until they expire.
+    """
+    generation_keys = list(generation_keys)
+
+    def increment():
+        cache = get_cache()
+        for key in generation_keys:
+            incr(key, cache)
+
+    transaction.on_commit(increment)
+
+
+def invalidate_recipes(recipe_ids):
+    """Drop cached lists and the details of the given recipes."""
+    bump([LIST_GENERATION, *(recipe_generation_key(pk) for pk in recipe_ids)])
+
+
+def invalidate_ingredients():
+    bump([LIST_GENERATION, INGREDIENTS_GENERATION])
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([HITS, MISSES])
+    hits, misses = values.get(HITS, 0), values.get(MISSES, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS, MISSES])
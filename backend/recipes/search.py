@@ -0,0 +1,70 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+SEARCH_CONFIGS = ("russian", "english")
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def search_vector_expression(recipe_ingredient_model, user_model):
+    """Build the stored ``Recipe.search_vector`` value.
+
+    Recipe and ingredient names and the text are indexed with every config in
+    ``SEARCH_CONFIGS``, the author's username with the ``simple`` config.
+    The models are passed in so that migrations can use historical ones.
+    """
+    ingredient_names = Subquery(
+        recipe_ingredient_model.objects.filter(recipe=OuterRef("pk"))
+        .order_by()
+        .values("recipe")
+        .annotate(names=StringAgg("ingredient__name", " "))
+        .values("names")
+    )
+    username = Subquery(
+        user_model.objects.filter(pk=OuterRef("author")).values("username")
+    )
+    vector = SearchVector(Coalesce(username, Value("")), weight="B", config="simple")
+    for config in SEARCH_CONFIGS:
+        vector = (
+            vector
+            + SearchVector("name", weight="A", config=config)
+            + SearchVector(
+                Coalesce(ingredient_names, Value(""), output_field=TextField()),
+                weight="B",
+                config=config,
+            )
+            + SearchVector("text", weight="C", config=config)
+        )
+    return vector
+
+
+def update_search_vectors(recipes):
+    """Recompute the stored vectors of a Recipe queryset on PostgreSQL."""
+    if not is_supported():
+        return 0
+    from django.contrib.auth import get_user_model
+
+    from .models import RecipeIngredient
+
+    return recipes.update(
+        search_vector=search_vector_expression(RecipeIngredient, get_user_model())
+    )
+
+
+def search_recipes(queryset, terms):
+    """Filter ``queryset`` by full-text ``terms`` and order it by rank."""
+    query = None
+    for config in SEARCH_CONFIGS:
+        config_query = SearchQuery(terms, config=config, search_type="websearch")
+        query = config_query if query is None else query | config_query
+    query |= SearchQuery(terms, config="simple", search_type="websearch")
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(search_rank=SearchRank(F("search_vector"), query))
+        .order_by("-search_rank", "-pub_date", "-id")
+    )
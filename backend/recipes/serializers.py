@@ -1,7 +1,12 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart
 from users.serializers import UserSerializer
-from .fields import Base64ImageField
+from . import ingredient_index, response_cache, search, shopping_list
+from .image_queue import DeferredImageMixin
+from core.thumbnails import RECIPE_THUMBNAIL_WIDTH
+from .fields import Base64ImageField, SrcsetField, ThumbnailField
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -26,6 +31,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.ImageField()
+    image_thumbnail = ThumbnailField("image", RECIPE_THUMBNAIL_WIDTH)
+    image_srcset = SrcsetField("image")
 
     class Meta:
         model = Recipe
@@ -36,23 +43,35 @@ class RecipeListSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_thumbnail",
+            "image_srcset",
+            "image_status",
             "text",
             "cooking_time",
             "ingredients",
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, "is_author_subscribed"):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
     def get_ingredients(self, obj):
         return IngredientInRecipeSerializer(
-            RecipeIngredient.objects.filter(recipe=obj), many=True
+            obj.recipeingredient_set.all(), many=True
         ).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return obj.favorited_by.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
@@ -63,15 +82,11 @@ class IngredientAmountSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=1)
 
-    def validate_id(self, value):
-        if not Ingredient.objects.filter(id=value).exists():
-            raise serializers.ValidationError(f"Ингредиент с ID {value} не найден.")
-        return value
-
 
-class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
+class RecipeCreateUpdateSerializer(DeferredImageMixin, serializers.ModelSerializer):
     ingredients = IngredientAmountSerializer(many=True)
-    image = Base64ImageField()
+    image = Base64ImageField(deferrable=True)
+    deferred_image_fields = ("image",)
     cooking_time = serializers.IntegerField(min_value=1)
 
     class Meta:
@@ -84,31 +99,83 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 "Список ингредиентов не может быть пустым."
             )
 
-        ingredient_ids = []
-        for item in ingredients_data:
-            if item["id"] in ingredient_ids:
-                raise serializers.ValidationError("Ингредиенты не должны повторяться.")
-            ingredient_ids.append(item["id"])
+        ingredient_ids = {item["id"] for item in ingredients_data}
+        if len(ingredient_ids) < len(ingredients_data):
+            raise serializers.ValidationError("Ингредиенты не должны повторяться.")
+
+        found = ingredient_index.existing_ids(ingredient_ids)
+        if len(found) < len(ingredient_ids):
+            raise serializers.ValidationError(
+                [
+                    (
+                        {}
+                        if item["id"] in found
+                        else {"id": [f"Ингредиент с ID {item['id']} не найден."]}
+                    )
+                    for item in ingredients_data
+                ]
+            )
         return ingredients_data
 
+    def _ingredients_changed(self, recipe):
+        search.update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        response_cache.invalidate_recipes([recipe.pk])
+
     def _set_ingredients(self, recipe, ingredients_data):
-        recipe_ingredients_to_create = []
-        for item_data in ingredients_data:
-            recipe_ingredients_to_create.append(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=item_data["id"],
+                amount=item_data["amount"],
+            )
+            for item_data in ingredients_data
+        )
+        self._ingredients_changed(recipe)
+
+    def _update_ingredients(self, recipe, new_amounts):
+        """Apply ``new_amounts`` (``{ingredient_id: amount}``) as a diff.
+
+        Rows keep their ids: changed amounts are bulk-updated, new
+        ingredients bulk-created and dropped ones deleted. Returns the old
+        amounts.
+        """
+        rows = {row.ingredient_id: row for row in recipe.recipeingredient_set.all()}
+        old_amounts = {key: row.amount for key, row in rows.items()}
+        changed = []
+        for ingredient_id, row in rows.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        added = new_amounts.keys() - rows.keys()
+        removed = rows.keys() - new_amounts.keys()
+        if not (changed or added or removed):
+            return old_amounts
+
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        if added:
+            RecipeIngredient.objects.bulk_create(
                 RecipeIngredient(
                     recipe=recipe,
-                    ingredient_id=item_data["id"],
-                    amount=item_data["amount"],
+                    ingredient_id=ingredient_id,
+                    amount=new_amounts[ingredient_id],
                 )
+                for ingredient_id in added
             )
-        RecipeIngredient.objects.bulk_create(recipe_ingredients_to_create)
+        if removed:
+            recipe.recipeingredient_set.filter(ingredient_id__in=removed).delete()
+        self._ingredients_changed(recipe)
+        return old_amounts
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients")
         recipe = Recipe.objects.create(**validated_data)
         self._set_ingredients(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if self.partial and "ingredients" not in self.initial_data:
             raise serializers.ValidationError(
@@ -121,17 +188,51 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         if ingredients_data is not None:
-            instance.recipeingredient_set.all().delete()
-            self._set_ingredients(instance, ingredients_data)
+            new_amounts = {item["id"]: item["amount"] for item in ingredients_data}
+            old_amounts = self._update_ingredients(instance, new_amounts)
+            if old_amounts != new_amounts:
+                shopping_list.apply_recipe_change(instance, old_amounts, new_amounts)
         return instance
 
     def to_representation(self, instance):
         return RecipeListSerializer(instance, context=self.context).data
 
 
+# Columns ``RecipeMinifiedSerializer`` reads.
+RECIPE_MINIFIED_FIELDS = ("name", "image", "image_variants", "cooking_time")
+
+
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
     image = Base64ImageField(read_only=True, required=False)
+    image_thumbnail = ThumbnailField("image", RECIPE_THUMBNAIL_WIDTH)
+    image_srcset = SrcsetField("image")
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = (
+            "id",
+            "name",
+            "image",
+            "image_thumbnail",
+            "image_srcset",
+            "cooking_time",
+        )
+
+
+# Largest BigAutoField value; bigger ids would overflow the raw SQL.
+MAX_ID = 9223372036854775807
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID),
+        allow_empty=False,
+    )
+
+    def validate_ids(self, value):
+        if len(value) > settings.BULK_MAX_IDS:
+            raise serializers.ValidationError(
+                f"Не больше {settings.BULK_MAX_IDS} ID за один запрос."
+            )
+        # Repeated ids are reported once.
+        return list(dict.fromkeys(value))
@@ -0,0 +1,200 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+User = get_user_model()
+
+
+def get_recipe_amounts(recipe):
+    """Return ``{ingredient_id: amount}`` for a recipe."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            "ingredient_id", "amount"
+        )
+    )
+
+
+def get_total_amounts(recipe_ids):
+    """Return ``{ingredient_id: amount}`` summed over several recipes."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by()
+        .values("ingredient_id")
+        .annotate(total=Sum("amount"))
+        .values_list("ingredient_id", "total")
+    )
+
+
+def touch_shopping_carts(user_ids):
+    """Mark the shopping lists of the given users as changed."""
+    User.objects.filter(id__in=user_ids).update(shopping_cart_modified=timezone.now())
+
+
+def touch_ingredient_lists(ingredient_id):
+    """Mark the shopping lists holding an ingredient as changed."""
+    touch_shopping_carts(
+        ShoppingListItem.objects.filter(ingredient_id=ingredient_id).values("user_id")
+    )
+
+
+def _add_amounts(user_ids, deltas, batch_size=1000):
+    """Add positive ``deltas`` with ``INSERT ... ON CONFLICT DO UPDATE``.
+
+    Concurrent additions of the same ingredient both land in one row
+    instead of one of them failing on the unique constraint.
+    """
+    quote = connection.ops.quote_name
+    opts = ShoppingListItem._meta
+    table = quote(opts.db_table)
+    total = quote(opts.get_field("total_amount").column)
+    user = quote(opts.get_field("user").column)
+    ingredient = quote(opts.get_field("ingredient").column)
+    rows = [
+        (user_id, ingredient_id, delta)
+        for user_id in user_ids
+        for ingredient_id, delta in deltas.items()
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            end = start + batch_size
+            batch = rows[start:end]
+            values = ", ".join(["(%s, %s, %s)"] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({user}, {ingredient}, {total}) "
+                f"VALUES {values} ON CONFLICT ({user}, {ingredient}) "
+                f"DO UPDATE SET {total} = {table}.{total} + EXCLUDED.{total}",
+                [value for row in batch for value in row],
+            )
+
+
+def apply_deltas(user_ids, deltas):
+    """Add ``deltas`` (``{ingredient_id: amount}``) to the users' lists.
+
+    Positive deltas are upserted, negative ones adjust the existing rows
+    with a single UPDATE and rows that drop to zero are removed.
+    """
+    deltas = {key: value for key, value in deltas.items() if value}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+
+    added = {key: value for key, value in deltas.items() if value > 0}
+    removed = {key: value for key, value in deltas.items() if value < 0}
+    with transaction.atomic():
+        if added:
+            _add_amounts(user_ids, added)
+        if removed:
+            items = ShoppingListItem.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=removed
+            )
+            items.update(
+                total_amount=Greatest(
+                    F("total_amount")
+                    + Case(
+                        *[
+                            When(ingredient_id=ingredient_id, then=Value(delta))
+                            for ingredient_id, delta in removed.items()
+                        ],
+                        output_field=IntegerField(),
+                    ),
+                    Value(0),
+                )
+            )
+            items.filter(total_amount=0).delete()
+
+
+def add_recipe(user_id, recipe):
+    apply_deltas([user_id], get_recipe_amounts(recipe))
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_deltas([user_id], get_total_amounts(recipe_ids))
+
+
+def remove_recipe(user_id, recipe):
+    apply_deltas(
+        [user_id],
+        {key: -value for key, value in get_recipe_amounts(recipe).items()},
+    )
+
+
+def apply_recipe_change(recipe, old_amounts, new_amounts):
+    """Propagate an edit of a recipe's ingredients to every cart holding it."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    if not any(deltas.values()):
+        return
+    user_ids = list(
+        ShoppingCart.objects.filter(recipe=recipe).values_list("user_id", flat=True)
+    )
+    apply_deltas(user_ids, deltas)
+    touch_shopping_carts(user_ids)
+
+
+def live_totals(user_ids=None, carts=None):
+    """Aggregate ``{(user_id, ingredient_id): total}`` from the cart itself.
+
+    ``carts`` defaults to ``ShoppingCart.objects``; migrations pass their
+    historical model's manager.
+    """
+    if carts is None:
+        carts = ShoppingCart.objects
+    rows = carts.values("user_id", "recipe__recipeingredient__ingredient")
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    rows = rows.annotate(total=Sum("recipe__recipeingredient__amount")).filter(
+        total__gt=0
+    )
+    return {
+        (row["user_id"], row["recipe__recipeingredient__ingredient"]): row["total"]
+        for row in rows.iterator()
+    }
+
+
+def stored_totals(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in items.values_list(
+            "user_id", "ingredient_id", "total_amount"
+        ).iterator()
+    }
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """Recompute the stored lists from scratch and return the row count.
+
+    Users whose list changed get a new ``shopping_cart_modified``, so that
+    cached downloads are not served as still current.
+    """
+    totals = live_totals(user_ids)
+    stored = stored_totals(user_ids)
+    changed = {
+        key[0]
+        for key in totals.keys() | stored.keys()
+        if totals.get(key) != stored.get(key)
+    }
+    with transaction.atomic():
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, total_amount=total
+                )
+                for (user_id, ingredient_id), total in totals.items()
+            ),
+            batch_size=batch_size,
+        )
+        touch_shopping_carts(changed)
+    return len(totals)
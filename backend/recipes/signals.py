@@ -0,0 +1,151 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.counters import increment
+
+from . import feed, image_queue, ingredient_index, response_cache, search, shopping_list
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+)
+
+User = get_user_model()
+
+
+def deleted_with(origin, model):
+    """Whether the deletion started from ``model`` rows (instance or queryset)."""
+    return isinstance(origin, model) or getattr(origin, "model", None) is model
+
+
+# The API writes favorites, carts and subscriptions with raw SQL and updates
+# the counters itself; these handlers cover the admin, other ORM writes and
+# cascades. Counters of rows deleted in the same cascade are left alone.
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(User.objects.filter(pk=instance.author_id), recipes_count=1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_uncounted(sender, instance, origin=None, **kwargs):
+    if not deleted_with(origin, User):
+        increment(User.objects.filter(pk=instance.author_id), recipes_count=-1)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(User.objects.filter(pk=instance.author_id), subscribers_count=1)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_uncounted(sender, instance, **kwargs):
+    increment(User.objects.filter(pk=instance.author_id), subscribers_count=-1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(Recipe.objects.filter(pk=instance.recipe_id), favorites_count=1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_uncounted(sender, instance, origin=None, **kwargs):
+    if not deleted_with(origin, Recipe):
+        increment(Recipe.objects.filter(pk=instance.recipe_id), favorites_count=-1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(sender, instance, created, raw=False, **kwargs):
+    # The API toggles write carts with raw SQL and update the lists
+    # themselves; this covers the admin and other ORM writes.
+    if created and not raw:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+        increment(Recipe.objects.filter(pk=instance.recipe_id), shopping_cart_count=1)
+    shopping_list.touch_shopping_carts([instance.user_id])
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, origin=None, **kwargs):
+    # Cart rows deleted along with their recipe were already taken out of
+    # the lists by ``remove_recipe_from_shopping_lists``.
+    if deleted_with(origin, ShoppingCart):
+        shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+    if not deleted_with(origin, Recipe):
+        increment(Recipe.objects.filter(pk=instance.recipe_id), shopping_cart_count=-1)
+    shopping_list.touch_shopping_carts([instance.user_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    shopping_list.apply_recipe_change(
+        instance, shopping_list.get_recipe_amounts(instance), {}
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    ingredient_index.invalidate()
+    response_cache.invalidate_ingredients()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_listed(sender, instance, created=False, **kwargs):
+    # Names and units are part of downloaded shopping lists.
+    if not created:
+        shopping_list.touch_ingredient_lists(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    search.update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+    image_queue.schedule_variants(instance, "image")
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        feed.publish(instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    response_cache.invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    response_cache.invalidate_recipes([instance.recipe_id])
+
+
+# Fields of the author that are part of the recipe representation.
+AUTHOR_FIELDS = {
+    "username",
+    "email",
+    "first_name",
+    "last_name",
+    "avatar",
+    "avatar_variants",
+    "avatar_status",
+}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "avatar" in update_fields:
+        image_queue.schedule_variants(instance, "avatar")
+    if update_fields is None or "username" in update_fields:
+        search.update_search_vectors(Recipe.objects.filter(author=instance))
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        response_cache.invalidate_recipes(instance.recipes.values_list("id", flat=True))
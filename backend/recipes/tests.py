@@ -1 +1,1781 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import tracemalloc
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import serializers, status
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from core import profiling, thumbnails
+
+from . import (
+    benchmarks,
+    image_queue,
+    importers,
+    ingredient_index,
+    query_plans,
+    response_cache,
+    shopping_list,
+)
+from .fields import MEMORY_BOUND, Base64ImageField
+from .models import (
+    Favorite,
+    FeedEntry,
+    ImageJob,
+    ImageStatus,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem,
+    Subscription,
+)
+
+User = get_user_model()
+
+
+class RecipeListQueryCountTest(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.user = User.objects.create_user(
+            email="reader@example.com",
+            username="reader",
+            first_name="Reader",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.author = User.objects.create_user(
+            email="author@example.com",
+            username="author",
+            first_name="Author",
+            last_name="User",
+            password="testpassword123",
+        )
+        Subscription.objects.create(user=self.user, author=self.author)
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"ingredient {i}", measurement_unit="г") for i in range(3)
+        )
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name=f"recipe {i}",
+                image="recipes/test.png",
+                text="text",
+                cooking_time=10,
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+                for ingredient in ingredients
+            )
+            if i % 2:
+                Favorite.objects.create(user=self.user, recipe=recipe)
+                ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.url = reverse("recipe-list")
+
+    def _count_queries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {"limit": limit})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), limit)
+        return len(context)
+
+    def test_anonymous_query_count_does_not_depend_on_page_size(self):
+        """Test that the anonymous list costs the same for any page size"""
+        self.assertEqual(self._count_queries(2), self._count_queries(12))
+
+    def test_authenticated_query_count_does_not_depend_on_page_size(self):
+        """Test that per-user flags are loaded without per-recipe queries"""
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self._count_queries(2), self._count_queries(12))
+
+    def test_authenticated_flags(self):
+        """Test that precomputed flags match the user's relations"""
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, {"limit": 12})
+        favorited = set(
+            Favorite.objects.filter(user=self.user).values_list("recipe", flat=True)
+        )
+        for item in response.data["results"]:
+            self.assertEqual(item["is_favorited"], item["id"] in favorited)
+            self.assertEqual(item["is_in_shopping_cart"], item["id"] in favorited)
+            self.assertTrue(item["author"]["is_subscribed"])
+            self.assertEqual(len(item["ingredients"]), 3)
+
+
+class DownloadShoppingCartTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="buyer@example.com",
+            username="buyer",
+            first_name="Buyer",
+            last_name="User",
+            password="testpassword123",
+        )
+        milk = Ingredient.objects.create(name="молоко", measurement_unit="мл")
+        eggs = Ingredient.objects.create(name="яйца", measurement_unit="шт")
+        for amount in (100, 250):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name=f"omelet {amount}",
+                image="recipes/test.png",
+                text="text",
+                cooking_time=10,
+            )
+            RecipeIngredient.objects.bulk_create(
+                [
+                    RecipeIngredient(recipe=recipe, ingredient=milk, amount=amount),
+                    RecipeIngredient(recipe=recipe, ingredient=eggs, amount=2),
+                ]
+            )
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        shopping_list.rebuild()
+        self.user.refresh_from_db()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("recipe-download-shopping-cart")
+
+    def test_plain_text_is_default(self):
+        """Test that the default export is an aggregated text file"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("- молоко (мл): 350", content)
+        self.assertIn("- яйца (шт): 4", content)
+
+    def test_csv_and_json_formats(self):
+        """Test the csv and json exports"""
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("молоко,мл,350", content)
+
+        response = self.client.get(self.url, {"format": "json"})
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)),
+            [
+                {"name": "молоко", "measurement_unit": "мл", "total_amount": 350},
+                {"name": "яйца", "measurement_unit": "шт", "total_amount": 4},
+            ],
+        )
+
+    def test_pdf_format(self):
+        """Test that the pdf export produces a document"""
+        response = self.client.get(self.url, {"format": "pdf"})
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    def test_not_modified_until_cart_changes(self):
+        """Test that a repeat download is answered with 304"""
+        etag = self.client.get(self.url)["ETag"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(context), 0)
+
+        recipe = Recipe.objects.first()
+        self.client.delete(reverse("recipe-shopping-cart", args=[recipe.id]))
+        self.user.refresh_from_db()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_ingredient_edit_changes_etag(self):
+        """Test that renaming a listed ingredient is not answered with 304"""
+        etag = self.client.get(self.url)["ETag"]
+        ingredient = Ingredient.objects.get(name="молоко")
+        ingredient.measurement_unit = "л"
+        ingredient.save()
+        self.user.refresh_from_db()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("молоко (л)", b"".join(response.streaming_content).decode())
+
+    def test_empty_cart(self):
+        """Test that an empty cart is rejected"""
+        for recipe in Recipe.objects.all():
+            self.client.delete(reverse("recipe-shopping-cart", args=[recipe.id]))
+        self.user.refresh_from_db()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ShoppingListMaintenanceTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="cook@example.com",
+            username="cook",
+            first_name="Cook",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.client.force_authenticate(self.user)
+        self.flour, self.sugar, self.salt = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in ("мука", "сахар", "соль")
+        )
+        self.recipes = []
+        for amount in (100, 200):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name=f"cake {amount}",
+                image="recipes/test.png",
+                text="text",
+                cooking_time=30,
+            )
+            RecipeIngredient.objects.bulk_create(
+                [
+                    RecipeIngredient(
+                        recipe=recipe, ingredient=self.flour, amount=amount
+                    ),
+                    RecipeIngredient(recipe=recipe, ingredient=self.sugar, amount=50),
+                ]
+            )
+            self.recipes.append(recipe)
+
+    def _totals(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user).values_list(
+                "ingredient__name", "total_amount"
+            )
+        )
+
+    def test_cart_toggles_apply_deltas(self):
+        """Test that adding and removing recipes adjusts the totals"""
+        for recipe in self.recipes:
+            self.client.post(reverse("recipe-shopping-cart", args=[recipe.id]))
+        self.assertEqual(self._totals(), {"мука": 300, "сахар": 100})
+
+        self.client.delete(reverse("recipe-shopping-cart", args=[self.recipes[0].id]))
+        self.assertEqual(self._totals(), {"мука": 200, "сахар": 50})
+
+        self.client.delete(reverse("recipe-shopping-cart", args=[self.recipes[1].id]))
+        self.assertEqual(self._totals(), {})
+
+    def test_recipe_update_and_delete_apply_deltas(self):
+        """Test that editing or deleting a carted recipe adjusts the totals"""
+        for recipe in self.recipes:
+            self.client.post(reverse("recipe-shopping-cart", args=[recipe.id]))
+        self.client.patch(
+            reverse("recipe-detail", args=[self.recipes[0].id]),
+            {
+                "ingredients": [
+                    {"id": self.flour.id, "amount": 10},
+                    {"id": self.salt.id, "amount": 5},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(self._totals(), {"мука": 210, "сахар": 50, "соль": 5})
+
+        self.recipes[1].delete()
+        self.assertEqual(self._totals(), {"мука": 10, "соль": 5})
+        call_command("rebuild_shopping_lists", "--check", stdout=StringIO())
+
+    def test_recipe_update_diffs_ingredient_rows(self):
+        """Test that an edit only touches the ingredient rows that changed"""
+        recipe = self.recipes[0]
+        url = reverse("recipe-detail", args=[recipe.id])
+        self.client.post(reverse("recipe-shopping-cart", args=[recipe.id]))
+        before = dict(recipe.recipeingredient_set.values_list("ingredient__name", "id"))
+        self.client.patch(
+            url,
+            {
+                "ingredients": [
+                    {"id": self.flour.id, "amount": 150},
+                    {"id": self.sugar.id, "amount": 50},
+                    {"id": self.salt.id, "amount": 5},
+                ]
+            },
+            format="json",
+        )
+        rows = {
+            name: (row_id, amount)
+            for name, row_id, amount in recipe.recipeingredient_set.values_list(
+                "ingredient__name", "id", "amount"
+            )
+        }
+        self.assertEqual(rows["мука"], (before["мука"], 150))
+        self.assertEqual(rows["сахар"], (before["сахар"], 50))
+        self.assertEqual(rows["соль"][1], 5)
+        self.assertEqual(self._totals(), {"мука": 150, "сахар": 50, "соль": 5})
+
+        self.client.patch(
+            url,
+            {"ingredients": [{"id": self.flour.id, "amount": 150}]},
+            format="json",
+        )
+        self.assertEqual(
+            list(recipe.recipeingredient_set.values_list("id", flat=True)),
+            [before["мука"]],
+        )
+        self.assertEqual(self._totals(), {"мука": 150})
+
+    def test_duplicate_ingredients_are_rejected(self):
+        """Test that an ingredient cannot be submitted twice"""
+        response = self.client.patch(
+            reverse("recipe-detail", args=[self.recipes[0].id]),
+            {
+                "ingredients": [
+                    {"id": self.flour.id, "amount": 10},
+                    {"id": self.flour.id, "amount": 5},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["ingredients"], ["Ингредиенты не должны повторяться."]
+        )
+
+    def test_unknown_ingredients_are_reported_per_item(self):
+        """Test that missing ingredient ids are flagged at their positions"""
+        response = self.client.patch(
+            reverse("recipe-detail", args=[self.recipes[0].id]),
+            {
+                "ingredients": [
+                    {"id": self.flour.id, "amount": 10},
+                    {"id": 9999, "amount": 5},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["ingredients"],
+            [{}, {"id": ["Ингредиент с ID 9999 не найден."]}],
+        )
+
+    def test_rebuild_command(self):
+        """Test that the command detects and repairs drift"""
+        # Bulk inserts send no signals, so the stored list falls behind.
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user=self.user, recipe=self.recipes[0])]
+        )
+        with self.assertRaises(CommandError):
+            call_command("rebuild_shopping_lists", "--check", stdout=StringIO())
+        call_command("rebuild_shopping_lists", stdout=StringIO())
+        self.assertEqual(self._totals(), {"мука": 100, "сахар": 50})
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.shopping_cart_modified)
+
+    def test_migration_fills_stored_lists(self):
+        """Test that carts from before the stored lists are carried over"""
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user=self.user, recipe=recipe) for recipe in self.recipes]
+        )
+        migration = import_module("recipes.migrations.0003_shoppinglistitem")
+        migration.fill_shopping_lists(apps, None)
+        call_command("rebuild_shopping_lists", "--check", stdout=StringIO())
+
+    def test_orm_cart_changes_apply_deltas(self):
+        """Test that carts written outside the API keep the list current"""
+        cart = ShoppingCart.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(self._totals(), {"мука": 100, "сахар": 50})
+        cart.delete()
+        self.assertEqual(self._totals(), {})
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        self.recipes[1].delete()
+        self.assertEqual(self._totals(), {})
+        call_command("rebuild_shopping_lists", "--check", stdout=StringIO())
+
+    def test_admin_inline_edit_applies_deltas(self):
+        """Test that editing amounts in the admin updates stored lists"""
+        recipe = self.recipes[0]
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        admin_user = User.objects.create_superuser(
+            email="admin@example.com",
+            username="admin",
+            first_name="Admin",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.client.force_login(admin_user)
+        rows = list(recipe.recipeingredient_set.order_by("id"))
+        data = {
+            "author": recipe.author_id,
+            "name": recipe.name,
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+            "recipeingredient_set-TOTAL_FORMS": len(rows),
+            "recipeingredient_set-INITIAL_FORMS": len(rows),
+            "recipeingredient_set-MIN_NUM_FORMS": 0,
+            "recipeingredient_set-MAX_NUM_FORMS": 1000,
+        }
+        for i, row in enumerate(rows):
+            data[f"recipeingredient_set-{i}-id"] = row.id
+            data[f"recipeingredient_set-{i}-recipe"] = recipe.id
+            data[f"recipeingredient_set-{i}-ingredient"] = row.ingredient_id
+            data[f"recipeingredient_set-{i}-amount"] = (
+                1000 if row.ingredient_id == self.flour.id else row.amount
+            )
+        response = self.client.post(
+            reverse("admin:recipes_recipe_change", args=[recipe.id]), data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._totals(), {"мука": 1000, "сахар": 50})
+
+
+class IngredientSearchTest(APITestCase):
+    def setUp(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in ("Ёжевика", "ежевичный джем", "мёд", "мед липовый", "соль")
+        )
+        Ingredient.objects.create(name="Ёрш", measurement_unit="шт")
+        self.url = reverse("ingredient-list")
+
+    def _names(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item["name"] for item in json.loads(response.content)]
+
+    def test_prefix_lookup_is_normalized(self):
+        """Test that lookups ignore case and the ё/е distinction"""
+        self.assertEqual(self._names(name="еж"), ["Ёжевика", "ежевичный джем"])
+        self.assertEqual(self._names(name="МЕД"), ["мёд", "мед липовый"])
+
+    def test_limit(self):
+        """Test that the number of results can be limited"""
+        self.assertEqual(len(self._names(limit=2)), 2)
+        self.assertEqual(len(self._names()), 6)
+
+    def test_index_is_invalidated_on_change(self):
+        """Test that saved and deleted ingredients show up immediately"""
+        self.assertEqual(self._names(name="со"), ["соль"])
+        Ingredient.objects.create(name="Сода", measurement_unit="г")
+        self.assertEqual(self._names(name="со"), ["Сода", "соль"])
+        Ingredient.objects.get(name="соль").delete()
+        self.assertEqual(self._names(name="со"), ["Сода"])
+
+    def test_existing_ids_use_the_index(self):
+        """Test that known ids resolve without queries and others fall back"""
+        ids = set(Ingredient.objects.values_list("id", flat=True))
+        ingredient_index.get_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(ingredient_index.existing_ids(ids), ids)
+        # bulk_create sends no signal, so the index does not know it yet.
+        (unseen,) = Ingredient.objects.bulk_create(
+            [Ingredient(name="перец", measurement_unit="г")]
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                ingredient_index.existing_ids({unseen.id, 9999}), {unseen.id}
+            )
+
+
+class CounterCacheTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="fan@example.com",
+            username="fan",
+            first_name="Fan",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.author = User.objects.create_user(
+            email="chef@example.com",
+            username="chef",
+            first_name="Chef",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="soup",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=20,
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_toggles_update_counters(self):
+        """Test that favorite, cart and subscribe actions keep counters"""
+        self.client.post(reverse("recipe-favorite", args=[self.recipe.id]))
+        self.client.post(reverse("recipe-shopping-cart", args=[self.recipe.id]))
+        self.client.post(reverse("users-subscribe", args=[self.author.id]))
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.shopping_cart_count, 1)
+        self.assertEqual(self.author.subscribers_count, 1)
+
+        self.client.delete(reverse("recipe-favorite", args=[self.recipe.id]))
+        self.client.delete(reverse("recipe-shopping-cart", args=[self.recipe.id]))
+        self.client.delete(reverse("users-subscribe", args=[self.author.id]))
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.shopping_cart_count, 0)
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_orm_writes_update_counters(self):
+        """Test that counters follow writes and cascades outside the API"""
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.shopping_cart_count, 1)
+        self.assertEqual(self.author.subscribers_count, 1)
+
+        self.user.delete()
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.shopping_cart_count, 0)
+        self.assertEqual(self.author.subscribers_count, 0)
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+        call_command("reconcile_counters", "--check", stdout=StringIO())
+
+    def test_recipe_delete_updates_author_counter(self):
+        """Test that deleting a recipe through the API decrements the count"""
+        self.client.force_authenticate(self.author)
+        call_command("reconcile_counters", stdout=StringIO())
+        self.client.delete(reverse("recipe-detail", args=[self.recipe.id]))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_reconcile_command(self):
+        """Test that the command detects and repairs drift"""
+        # Bulk inserts send no signals, so the counter falls behind.
+        Favorite.objects.bulk_create([Favorite(user=self.user, recipe=self.recipe)])
+        with self.assertRaises(CommandError):
+            call_command("reconcile_counters", "--check", stdout=StringIO())
+        call_command("reconcile_counters", stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        call_command("reconcile_counters", "--check", stdout=StringIO())
+
+
+class RecipeSearchTest(APITestCase):
+    def setUp(self):
+        author = User.objects.create_user(
+            email="baker@example.com",
+            username="baker",
+            first_name="Baker",
+            last_name="User",
+            password="testpassword123",
+        )
+        for name in ("Борщ", "Блины", "Pancakes"):
+            Recipe.objects.create(
+                author=author,
+                name=name,
+                image="recipes/test.png",
+                text="text",
+                cooking_time=20,
+            )
+        self.url = reverse("recipe-list")
+
+    def _names(self, term):
+        response = self.client.get(self.url, {"search": term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item["name"] for item in response.data["results"])
+
+    def test_search_by_name_and_author(self):
+        """Test recipe search (icontains fallback outside PostgreSQL)"""
+        self.assertEqual(self._names("Борщ"), ["Борщ"])
+        self.assertEqual(self._names("pancake"), ["Pancakes"])
+        self.assertEqual(self._names("baker"), ["Pancakes", "Блины", "Борщ"])
+        self.assertEqual(self._names("пицца"), [])
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="scroller@example.com",
+            username="scroller",
+            first_name="Scroller",
+            last_name="User",
+            password="testpassword123",
+        )
+        for i in range(5):
+            author = User.objects.create_user(
+                email=f"author{i}@example.com",
+                username=f"author{i}",
+                first_name="Author",
+                last_name="User",
+                password="testpassword123",
+            )
+            Subscription.objects.create(user=self.user, author=author)
+            for j in range(2):
+                Recipe.objects.create(
+                    author=author,
+                    name=f"recipe {i}-{j}",
+                    image="recipes/test.png",
+                    text="text",
+                    cooking_time=10,
+                )
+
+    def _walk(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(item["id"] for item in response.data["results"])
+            pages += 1
+            if not response.data["next"]:
+                return ids, pages
+            response = self.client.get(response.data["next"])
+
+    def test_recipe_feed_cursor_mode(self):
+        """Test that cursor mode walks the feed newest first without gaps"""
+        ids, pages = self._walk(
+            reverse("recipe-list"), {"paginate": "cursor", "limit": 3}
+        )
+        self.assertEqual(
+            ids,
+            list(
+                Recipe.objects.order_by("-pub_date", "-id").values_list("id", flat=True)
+            ),
+        )
+        self.assertEqual(pages, 4)
+
+    def test_subscriptions_cursor_mode(self):
+        """Test that subscriptions can be walked with a cursor"""
+        self.client.force_authenticate(self.user)
+        ids, pages = self._walk(
+            reverse("users-subscriptions"), {"paginate": "cursor", "limit": 2}
+        )
+        self.assertEqual(
+            ids,
+            list(
+                Subscription.objects.filter(user=self.user)
+                .order_by("-id")
+                .values_list("author_id", flat=True)
+            ),
+        )
+        self.assertEqual(pages, 3)
+
+    def test_approximate_count(self):
+        """Test that the approximate count mode still reports a count"""
+        response = self.client.get(reverse("recipe-list"), {"count": "approximate"})
+        self.assertEqual(response.data["count"], 10)
+
+
+class AnonymousResponseCacheTest(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.author = User.objects.create_user(
+            email="writer@example.com",
+            username="writer",
+            first_name="Writer",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.ingredient = Ingredient.objects.create(name="рис", measurement_unit="г")
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="плов",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=60,
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=200
+        )
+        self.list_url = reverse("recipe-list")
+        self.detail_url = reverse("recipe-detail", args=[self.recipe.id])
+
+    def test_repeat_requests_are_served_from_cache(self):
+        """Test that identical anonymous requests hit the cache"""
+        self.assertEqual(self.client.get(self.list_url)["X-Cache"], "MISS")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.list_url, {"is_favorited": 1})
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(context), 0)
+        self.assertEqual(response.data["results"][0]["name"], "плов")
+        self.assertEqual(self.client.get(self.detail_url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(self.detail_url)["X-Cache"], "HIT")
+        self.assertEqual(response_cache.stats()["hits"], 2)
+
+    def test_changes_invalidate_cached_responses(self):
+        """Test that recipe, ingredient and author changes bump generations"""
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.name = "плов узбекский"
+            self.recipe.save()
+            # Until the write commits, readers keep the old generation.
+            self.assertEqual(self.client.get(self.detail_url)["X-Cache"], "HIT")
+        for callback in callbacks:
+            callback()
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["name"], "плов узбекский")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = "рис басмати"
+            self.ingredient.save()
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data["ingredients"][0]["name"], "рис басмати")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = "Renamed"
+            self.author.save()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["author"]["first_name"], "Renamed")
+
+    def test_non_canonical_ids_are_not_found(self):
+        """Test that ids such as 05 cannot reach a never-bumped cache entry"""
+        for pk in (f"0{self.recipe.id}", "abc"):
+            with self.subTest(pk=pk):
+                response = self.client.get(reverse("recipe-detail", args=[pk]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_authenticated_requests_bypass_cache(self):
+        """Test that personalized responses are never cached"""
+        self.client.force_authenticate(self.author)
+        self.assertNotIn("X-Cache", self.client.get(self.list_url))
+
+
+class PersonalizedOverlayTest(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.user = User.objects.create_user(
+            email="member@example.com",
+            username="member",
+            first_name="Member",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.author = User.objects.create_user(
+            email="blogger@example.com",
+            username="blogger",
+            first_name="Blogger",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="салат",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=5,
+        )
+        self.client.force_authenticate(self.user)
+        self.url = reverse("recipe-list")
+
+    def test_shared_bodies_are_reused(self):
+        """Test that a warm cache only costs the page and flag queries"""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tables = " ".join(query["sql"] for query in context.captured_queries)
+        self.assertNotIn("recipes_recipeingredient", tables)
+        self.assertEqual(len(context), 3)
+
+    def test_toggles_are_reflected_immediately(self):
+        """Test that per-user flags are overlaid on cached bodies"""
+        self.client.get(self.url)
+        self.client.post(reverse("recipe-favorite", args=[self.recipe.id]))
+        self.client.post(reverse("users-subscribe", args=[self.author.id]))
+        item = self.client.get(self.url).data["results"][0]
+        self.assertTrue(item["is_favorited"])
+        self.assertFalse(item["is_in_shopping_cart"])
+        self.assertTrue(item["author"]["is_subscribed"])
+
+        detail = self.client.get(reverse("recipe-detail", args=[self.recipe.id]))
+        self.assertTrue(detail.data["is_favorited"])
+
+        other = User.objects.create_user(
+            email="other@example.com",
+            username="other",
+            first_name="Other",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.client.force_authenticate(other)
+        item = self.client.get(self.url).data["results"][0]
+        self.assertFalse(item["is_favorited"])
+        self.assertFalse(item["author"]["is_subscribed"])
+
+
+def make_image(name, size=(800, 600)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "orange").save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ImageVariantTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        response_cache.get_cache().clear()
+        self.author = User.objects.create_user(
+            email="painter@example.com",
+            username="painter",
+            first_name="Painter",
+            last_name="User",
+            password="testpassword123",
+        )
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name="pie",
+                image=make_image("pie.png"),
+                text="text",
+                cooking_time=5,
+            )
+        image_queue.work(once=True)
+        return recipe
+
+    def test_variants_are_rendered_after_commit(self):
+        """Test that saving only queues the variants for the worker"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name="pie",
+                image=make_image("pie.png"),
+                text="text",
+                cooking_time=5,
+            )
+        self.assertFalse(ImageJob.objects.exists())
+        callbacks[0]()
+        job = ImageJob.objects.get()
+        self.assertEqual(job.kind, ImageJob.Kind.VARIANTS)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, {})
+        item = self.client.get(reverse("recipe-list")).data["results"][0]
+        self.assertTrue(item["image_thumbnail"].endswith(recipe.image.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(image_queue.work(once=True), 1)
+        self.assertFalse(ImageJob.objects.exists())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants["source"], recipe.image.name)
+        item = self.client.get(reverse("recipe-list")).data["results"][0]
+        self.assertTrue(
+            item["image_thumbnail"].endswith(
+                recipe.image_variants["jpeg"]["640"]["name"]
+            )
+        )
+
+    def test_variants_are_generated_without_upscaling(self):
+        """Test that every format is rendered without upscaling"""
+        recipe = self.create_recipe()
+        recipe.refresh_from_db()
+        variants = recipe.image_variants
+        self.assertEqual(variants["source"], recipe.image.name)
+        for image_format in thumbnails.get_formats():
+            sizes = variants[image_format.lower()]
+            self.assertEqual(set(sizes), {"320", "640", "1280"})
+            self.assertEqual(sizes["1280"]["width"], 800)
+            with Image.open(recipe.image.storage.open(sizes["320"]["name"])) as image:
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(image.width, 320)
+            with Image.open(recipe.image.storage.open(sizes["1280"]["name"])) as image:
+                self.assertEqual(image.width, 800)
+
+    def test_list_exposes_thumbnail_and_srcset(self):
+        """Test that the recipe payload links the resized variants"""
+        recipe = self.create_recipe()
+        recipe.refresh_from_db()
+        item = self.client.get(reverse("recipe-list")).data["results"][0]
+        jpeg = recipe.image_variants["jpeg"]
+        self.assertTrue(item["image_thumbnail"].endswith(jpeg["640"]["name"]))
+        self.assertTrue(item["image_thumbnail"].startswith("http://testserver/"))
+        self.assertIn("jpeg", item["image_srcset"])
+        self.assertIn(" 320w, ", item["image_srcset"]["webp"])
+
+    def test_srcset_uses_real_widths(self):
+        """Test that a small image is listed at its own width, once"""
+        recipe = self.create_recipe()
+        recipe.refresh_from_db()
+        item = self.client.get(reverse("recipe-list")).data["results"][0]
+        descriptors = [
+            candidate.split(" ")[1]
+            for candidate in item["image_srcset"]["webp"].split(", ")
+        ]
+        self.assertEqual(descriptors, ["320w", "640w", "800w"])
+
+    def test_missing_variants_fall_back_to_original(self):
+        """Test that recipes without variants still expose a thumbnail"""
+        recipe = self.create_recipe()
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants={})
+        response_cache.get_cache().clear()
+        item = self.client.get(reverse("recipe-list")).data["results"][0]
+        self.assertTrue(item["image_thumbnail"].endswith(recipe.image.name))
+        self.assertEqual(item["image_srcset"], {})
+
+        out = StringIO()
+        call_command("generate_image_variants", workers=1, stdout=out)
+        self.assertIn("Generated variants for 1 of 1 images.", out.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants["source"], recipe.image.name)
+
+
+def make_data_uri(image, image_format="PNG", trailer=b"", suffix=""):
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    encoded = base64.b64encode(buffer.getvalue() + trailer).decode()
+    return f"data:image/{image_format.lower()};base64,{encoded}{suffix}"
+
+
+class Base64ImageFieldTest(APITestCase):
+    def test_decodes_data_uri(self):
+        """Test that a data URI becomes a validated image file"""
+        data = make_data_uri(Image.new("RGB", (40, 30), "green"))
+        image = Base64ImageField().to_internal_value(data)
+        self.assertTrue(image.name.endswith(".png"))
+        self.assertEqual(image.content_type, "image/png")
+        self.assertEqual(image.image.size, (40, 30))
+
+    def test_decodes_wrapped_base64(self):
+        """Test that line breaks and spaces in the payload are skipped"""
+        data = make_data_uri(Image.new("RGB", (300, 200), "green"), "BMP")
+        prefix, encoded = data.split(",")
+        wrapped = "\n".join(textwrap.wrap(encoded, 76))
+        image = Base64ImageField().to_internal_value(f"{prefix},{wrapped}\r\n ")
+        self.assertEqual(image.image.size, (300, 200))
+
+    def test_rejects_large_payload_before_decoding(self):
+        """Test that the byte limit is checked from the encoded length"""
+        data = "data:image/png;base64," + "!" * 4000
+        with self.assertRaisesMessage(serializers.ValidationError, "1000 bytes"):
+            Base64ImageField(max_bytes=1000).to_internal_value(data)
+
+    def test_rejects_too_many_pixels_from_header(self):
+        """Test that oversized dimensions fail before the rest is decoded"""
+        data = make_data_uri(
+            Image.new("1", (8000, 8000)), trailer=bytes(128 * 1024), suffix="!!!!"
+        )
+        with self.assertRaisesMessage(serializers.ValidationError, "pixels"):
+            Base64ImageField(max_pixels=10_000_000).to_internal_value(data)
+
+    def test_rejects_invalid_data(self):
+        """Test that broken base64 and non-images are validation errors"""
+        field = Base64ImageField()
+        with self.assertRaises(serializers.ValidationError):
+            field.to_internal_value("data:image/png;base64,abc!")
+        with self.assertRaises(serializers.ValidationError):
+            field.to_internal_value(
+                "data:image/png;base64," + base64.b64encode(b"text").decode()
+            )
+
+    def test_memory_is_bounded(self):
+        """Test that decoding a large image stays within MEMORY_BOUND"""
+        size = (1600, 1400)
+        image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+        data = make_data_uri(image)
+        del image
+        self.assertGreater(len(data), 5 * MEMORY_BOUND)
+
+        tracemalloc.start()
+        try:
+            decoded = Base64ImageField().to_internal_value(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(decoded.image.size, size)
+        self.assertLess(peak, MEMORY_BOUND)
+
+
+@override_settings(
+    IMAGE_PROCESSING_ASYNC=True, IMAGE_JOB_MAX_ATTEMPTS=2, IMAGE_JOB_RETRY_DELAY=0
+)
+class ImageQueueTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            email="baker@example.com",
+            username="baker",
+            first_name="Baker",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.ingredient = Ingredient.objects.create(name="мука", measurement_unit="г")
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, image):
+        return self.client.post(
+            reverse("recipe-list"),
+            {
+                "ingredients": [{"id": self.ingredient.id, "amount": 100}],
+                "image": image,
+                "name": "хлеб",
+                "text": "text",
+                "cooking_time": 30,
+            },
+            format="json",
+        )
+
+    def rotated_jpeg(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        buffer = BytesIO()
+        Image.new("RGB", (400, 200), "brown").save(buffer, "JPEG", exif=exif)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/jpeg;base64,{encoded}"
+
+    def test_recipe_image_is_processed_in_background(self):
+        """Test that creation only queues the image for the worker"""
+        response = self.create_recipe(self.rotated_jpeg())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(response.data["image"])
+        self.assertEqual(response.data["image_status"], ImageStatus.PENDING)
+        self.assertEqual(ImageJob.objects.count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "recipes")))
+
+        call_command("process_image_jobs", workers=1, once=True, stdout=StringIO())
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        self.assertEqual(recipe.image_status, ImageStatus.READY)
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(recipe.image_variants["source"], recipe.image.name)
+        with Image.open(recipe.image) as image:
+            self.assertEqual(image.size, (200, 400))
+            self.assertNotIn(0x0112, image.getexif())
+
+    def test_invalid_upload_is_dead_lettered(self):
+        """Test that an undecodable image fails without retries"""
+        payload = base64.b64encode(b"not an image").decode()
+        response = self.create_recipe(f"data:image/png;base64,{payload}")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with self.assertLogs("recipes.image_queue", "ERROR"):
+            image_queue.work(once=True)
+        job = ImageJob.objects.get()
+        self.assertEqual(job.status, ImageJob.Status.FAILED)
+        self.assertEqual(job.attempts, 1)
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        self.assertEqual(recipe.image_status, ImageStatus.FAILED)
+
+    def test_transient_errors_are_retried(self):
+        """Test retries up to the attempt limit and requeueing dead letters"""
+        response = self.create_recipe(self.rotated_jpeg())
+        with mock.patch.object(
+            image_queue, "reencode", side_effect=OSError("disk full")
+        ), self.assertLogs("recipes.image_queue", "ERROR"):
+            self.assertEqual(image_queue.work(once=True), 2)
+        job = ImageJob.objects.get()
+        self.assertEqual(job.status, ImageJob.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn("disk full", job.last_error)
+
+        image_queue.requeue(ImageJob.objects.all())
+        image_queue.work(once=True)
+        recipe = Recipe.objects.get(pk=response.data["id"])
+        self.assertEqual(recipe.image_status, ImageStatus.READY)
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_avatar_upload_is_queued(self):
+        """Test that avatars go through the same queue"""
+        response = self.client.put(
+            reverse("user-me-avatar"),
+            {"avatar": make_data_uri(Image.new("RGB", (300, 300)))},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["avatar_status"], ImageStatus.PENDING)
+
+        image_queue.work(once=True)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_status, ImageStatus.READY)
+        self.assertTrue(self.user.avatar.name.startswith("avatars/"))
+        self.assertIn("webp", self.user.avatar_variants)
+
+
+class IngredientImportTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def load(self, path, *args):
+        out = StringIO()
+        call_command("load_foodgram_data", "--source", path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_formats_are_parsed_alike(self):
+        """Test that CSV, JSON and JSONL sources yield the same rows"""
+        items = [
+            {"name": "соль", "measurement_unit": "г"},
+            {"name": "молоко", "measurement_unit": "мл"},
+        ]
+        sources = {
+            "csv": "соль,г\nмолоко, мл\n",
+            "json": json.dumps(items, ensure_ascii=False, indent=2),
+            "jsonl": "\n".join(json.dumps(item) for item in items),
+        }
+        for file_format, content in sources.items():
+            with open(self.write(f"i.{file_format}", content), encoding="utf-8") as f:
+                rows = list(importers.read_ingredients(f, file_format))
+            self.assertEqual(rows, [("соль", "г"), ("молоко", "мл")], file_format)
+
+    def test_json_is_streamed_across_chunks(self):
+        """Test that array items split between reads are decoded"""
+        items = [{"name": f"item {i}", "measurement_unit": "г"} for i in range(5000)]
+        path = self.write("big.json", json.dumps(items))
+        with open(path, encoding="utf-8") as f:
+            rows = list(importers.read_ingredients(f, "json"))
+        self.assertEqual(len(rows), 5000)
+        self.assertEqual(rows[-1], ("item 4999", "г"))
+
+    def test_import_is_batched_and_idempotent(self):
+        """Test deduplication, batching and repeated runs"""
+        Ingredient.objects.create(name="соль", measurement_unit="г")
+        path = self.write("i.csv", "соль,г\nсахар,г\nсахар,г\nмука,г\nрис,г\n")
+        with CaptureQueriesContext(connection) as context:
+            output = self.load(path, "--batch-size", "2", "--dry-run")
+        self.assertIn("3 new ingredients would be loaded", output)
+        self.assertEqual(len(context), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+
+        with open(path, encoding="utf-8") as f, CaptureQueriesContext(
+            connection
+        ) as context:
+            importers.import_ingredients(importers.read_csv(f), batch_size=3)
+        inserts = [q for q in context.captured_queries if "INSERT" in q["sql"]]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+        self.assertIn("0 new ingredients would be", self.load(path, "--dry-run"))
+
+    def test_import_invalidates_ingredient_caches(self):
+        """Test that bulk inserts are visible to the ingredient search"""
+        self.assertEqual(self.client.get(reverse("ingredient-list")).json(), [])
+        self.load(self.write("i.jsonl", '{"name": "соль", "measurement_unit": "г"}'))
+        response = self.client.get(reverse("ingredient-list"), {"name": "со"})
+        self.assertEqual([item["name"] for item in response.json()], ["соль"])
+
+
+class GenerateLoadDataTest(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент {i}", measurement_unit="г") for i in range(50)
+        )
+
+    def generate(self, prefix, seed=7):
+        call_command(
+            "generate_load_data",
+            users=20,
+            recipes=60,
+            favorites=200,
+            carts=40,
+            subscriptions=80,
+            seed=seed,
+            prefix=prefix,
+            batch_size=25,
+            stdout=StringIO(),
+        )
+        users = User.objects.filter(username__startswith=f"{prefix}_")
+        return sorted(users.values_list("recipes_count", "subscribers_count"))
+
+    def test_dataset_is_consistent(self):
+        """Test that counters and shopping lists match the generated rows"""
+        self.generate("load")
+        self.assertEqual(Recipe.objects.count(), 60)
+        self.assertEqual(User.objects.count(), 20)
+        self.assertTrue(0 < Favorite.objects.count() <= 200)
+        self.assertFalse(Subscription.objects.filter(user_id=F("author_id")).exists())
+        call_command("reconcile_counters", check=True, stdout=StringIO())
+        call_command("rebuild_shopping_lists", check=True, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            self.generate("load")
+
+    def test_dataset_is_reproducible(self):
+        """Test that the same seed yields the same distribution"""
+        self.assertEqual(self.generate("first"), self.generate("second"))
+
+
+class BenchmarkBaselineTest(APITestCase):
+    def setUp(self):
+        if benchmarks.find_ingredients_source() is None:
+            self.skipTest("data/ingredients.csv is not available")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_query_counts_do_not_regress(self):
+        """Test every endpoint against the query counts of the baseline"""
+        benchmarks.generate("tiny")
+        results = {"tiny": benchmarks.run(iterations=1)}
+        baseline = benchmarks.load_baseline()
+        self.assertEqual(set(results["tiny"]), set(baseline["tiny"]))
+        self.assertEqual(benchmarks.compare(results, baseline), [])
+
+    def test_percentile_interpolates(self):
+        """Test that p95 of 20 samples is not simply their maximum"""
+        self.assertAlmostEqual(benchmarks.percentile(range(1, 21), 0.95), 19.05)
+        self.assertEqual(benchmarks.percentile([5], 0.95), 5)
+
+
+class PerformanceMiddlewareTest(APITestCase):
+    def setUp(self):
+        author = User.objects.create_user(
+            email="timer@example.com",
+            username="timer",
+            first_name="Timer",
+            last_name="User",
+            password="testpassword123",
+        )
+        Recipe.objects.create(
+            author=author,
+            name="суп",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=5,
+        )
+
+    def get_logged(self, *args):
+        with self.assertLogs("core.profiling", "INFO") as logs:
+            response = self.client.get(*args)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_server_timing_and_log_line(self):
+        """Test the Server-Timing header and the structured log record"""
+        response, record = self.get_logged(reverse("recipe-list"), {"limit": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{record["queries"]} queries"', timing)
+        self.assertIn("serialize;dur=", timing)
+        self.assertEqual(record["view"], "recipe-list")
+        self.assertEqual(record["action"], "list")
+        self.assertGreater(record["queries"], 0)
+        self.assertGreater(record["serialize_ms"], 0)
+        self.assertEqual(record["response_bytes"], len(response.content))
+        self.assertNotIn("sql", record)
+
+    @override_settings(PERF_SQL_SAMPLE_RATE=1)
+    def test_sampled_requests_log_sql(self):
+        """Test that sampled requests carry every statement"""
+        _, record = self.get_logged(reverse("ingredient-list"), {"name": "с"})
+        self.assertEqual(len(record["sql"]), record["queries"])
+
+    def test_duplicate_queries_are_fingerprinted(self):
+        """Test that repeated statements differing only in values are grouped"""
+        profile = profiling.RequestProfile()
+        with profile.track():
+            for recipe_id in (1, 2, 3):
+                list(Recipe.objects.filter(pk=recipe_id))
+            list(Recipe.objects.filter(pk__in=[1, 2]))
+            list(Recipe.objects.filter(pk__in=[1, 2, 3]))
+        duplicates = list(profile.duplicates().values())
+        self.assertEqual(sorted(duplicates), [2, 3])
+
+
+class MetricsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="metrics@example.com",
+            username="metrics",
+            first_name="Metrics",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name="суп",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=5,
+        )
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics_per_route_and_action(self):
+        """Test that requests are counted per route name and action"""
+        labels = {"route": "recipe-list", "action": "list"}
+        requests = self.sample(
+            "foodgram_http_requests_total", method="GET", status="200", **labels
+        )
+        queries = self.sample("foodgram_db_queries_per_request_count", **labels)
+        self.client.get(reverse("recipe-list"))
+        self.assertEqual(
+            self.sample(
+                "foodgram_http_requests_total", method="GET", status="200", **labels
+            ),
+            requests + 1,
+        )
+        self.assertEqual(
+            self.sample("foodgram_db_queries_per_request_count", **labels),
+            queries + 1,
+        )
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            "foodgram_http_request_duration_seconds_bucket{"
+            'action="list",le="0.005",route="recipe-list"}',
+            response.content.decode(),
+        )
+
+    def test_domain_and_cache_counters(self):
+        """Test the favorite, download and cache lookup counters"""
+        favorites = self.sample("foodgram_favorites_added_total")
+        hits = self.sample(
+            "foodgram_cache_lookups_total", cache="responses", result="hit"
+        )
+        self.client.force_authenticate(self.user)
+        self.client.post(reverse("recipe-favorite", args=[self.recipe.pk]))
+        self.assertEqual(self.sample("foodgram_favorites_added_total"), favorites + 1)
+
+        self.client.force_authenticate(None)
+        self.client.get(reverse("recipe-list"))
+        self.client.get(reverse("recipe-list"))
+        self.assertGreater(
+            self.sample(
+                "foodgram_cache_lookups_total", cache="responses", result="hit"
+            ),
+            hits,
+        )
+
+    def test_samples_are_summed_over_processes(self):
+        """Test that the endpoint aggregates the samples of other processes"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}
+        for _ in range(2):
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    "from core import metrics; metrics.FAVORITES_ADDED.inc()",
+                ],
+                cwd=settings.BASE_DIR,
+                env=env,
+                check=True,
+            )
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+            response = self.client.get(reverse("metrics"))
+        self.assertIn("foodgram_favorites_added_total 2.0", response.content.decode())
+
+
+class QueryPlanTest(APITestCase):
+    def test_canonical_queries_use_indexes(self):
+        """Test that no canonical query plan reads a whole table"""
+        out = StringIO()
+        call_command("explain_queries", stdout=out)
+        self.assertIn("Every canonical query uses an index.", out.getvalue())
+
+    def test_unsupported_database_is_a_command_error(self):
+        """Test that a database without scan patterns fails clearly"""
+        with mock.patch.dict(query_plans.SEQUENTIAL_SCAN_RES, clear=True):
+            with self.assertRaisesMessage(CommandError, "cannot be checked"):
+                call_command("explain_queries", stdout=StringIO())
+
+    def test_sequential_scans_are_detected(self):
+        """Test the sequential scan patterns of both databases"""
+        postgres_plan = (
+            "Limit  (cost=0.28..1.02 rows=12 width=8)\n"
+            "  ->  Index Scan using recipe_feed_idx on recipes_recipe\n"
+            "  ->  Seq Scan on recipes_favorite  (cost=0.00..35.50 rows=10)"
+        )
+        sqlite_plan = (
+            "5 0 0 SCAN recipes_recipe USING INDEX recipe_feed_idx\n"
+            "9 0 0 SCAN recipes_favorite\n"
+            "20 0 0 USE TEMP B-TREE FOR ORDER BY"
+        )
+        for vendor, plan in (("postgresql", postgres_plan), ("sqlite", sqlite_plan)):
+            with self.subTest(vendor=vendor):
+                self.assertEqual(
+                    query_plans.sequential_scans(plan, vendor), ["recipes_favorite"]
+                )
+
+    def test_recipe_ingredients_are_unique(self):
+        """Test that an ingredient cannot be listed twice in a recipe"""
+        author = User.objects.create_user(
+            email="plans@example.com",
+            username="plans",
+            first_name="Plans",
+            last_name="User",
+            password="testpassword123",
+        )
+        recipe = Recipe.objects.create(
+            author=author,
+            name="суп",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=5,
+        )
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=salt, amount=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=salt, amount=2)
+
+
+class ToggleTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="toggle@example.com",
+            username="toggle",
+            first_name="Toggle",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.author = User.objects.create_user(
+            email="toggle-chef@example.com",
+            username="toggle_chef",
+            first_name="Chef",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name="soup",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=20,
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_toggles_are_rejected(self):
+        """Test that adding twice or removing twice keeps the 400 responses"""
+        urls = [
+            reverse("recipe-favorite", args=[self.recipe.id]),
+            reverse("recipe-shopping-cart", args=[self.recipe.id]),
+            reverse("users-subscribe", args=[self.author.id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 201)
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("errors", response.data)
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                response = self.client.delete(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("errors", response.data)
+
+    def test_missing_targets_are_not_found(self):
+        """Test that toggles on unknown recipes and authors return 404"""
+        for name in ("recipe-favorite", "recipe-shopping-cart", "users-subscribe"):
+            for method in ("post", "delete"):
+                with self.subTest(name=name, method=method):
+                    response = getattr(self.client, method)(
+                        reverse(name, args=[999999])
+                    )
+                    self.assertEqual(response.status_code, 404)
+
+    def test_toggle_writes_in_single_statements(self):
+        """Test that a toggle links and counts without reading first"""
+        url = reverse("recipe-favorite", args=[self.recipe.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["name"], "soup")
+        # Insert and counter update, inside a savepoint.
+        self.assertEqual(
+            [q["sql"].split()[0] for q in queries if "SAVEPOINT" not in q["sql"]],
+            ["INSERT", "UPDATE"],
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(
+            [q["sql"].split()[0] for q in queries if "SAVEPOINT" not in q["sql"]],
+            ["DELETE", "UPDATE"],
+        )
+
+    def test_subscribe_response(self):
+        """Test that the subscribe response is built from the counter update"""
+        response = self.client.post(reverse("users-subscribe", args=[self.author.id]))
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data["is_subscribed"])
+        self.assertEqual(response.data["username"], "toggle_chef")
+        self.assertEqual(response.data["recipes_count"], 1)
+        self.assertEqual(len(response.data["recipes"]), 1)
+
+
+class ConcurrentToggleTest(APITransactionTestCase):
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("In-memory SQLite fails concurrent writers with locks.")
+        self.user = User.objects.create_user(
+            email="race@example.com",
+            username="race",
+            first_name="Race",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name="soup",
+            image="recipes/test.png",
+            text="text",
+            cooking_time=20,
+        )
+
+    def run_in_parallel(self, method, url, count=4):
+        barrier = threading.Barrier(count)
+        statuses = []
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_concurrent_double_clicks(self):
+        """Test that parallel toggles change the row and counter exactly once"""
+        url = reverse("recipe-favorite", args=[self.recipe.id])
+        self.assertEqual(self.run_in_parallel("post", url), [201, 400, 400, 400])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(Favorite.objects.filter(recipe=self.recipe).count(), 1)
+
+        self.assertEqual(self.run_in_parallel("delete", url), [204, 400, 400, 400])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertFalse(Favorite.objects.filter(recipe=self.recipe).exists())
+
+
+class BulkToggleTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="bulk@example.com",
+            username="bulk",
+            first_name="Bulk",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.author = User.objects.create_user(
+            email="bulk-chef@example.com",
+            username="bulk_chef",
+            first_name="Chef",
+            last_name="User",
+            password="testpassword123",
+        )
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        self.recipes = []
+        for name in ("soup", "stew", "salad"):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name=name,
+                image="recipes/test.png",
+                text="text",
+                cooking_time=20,
+            )
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=salt, amount=5)
+            self.recipes.append(recipe)
+        self.salt = salt
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_favorite_reports_each_id(self):
+        """Test that a bulk add links new recipes and reports the rest"""
+        first, second, third = [recipe.id for recipe in self.recipes]
+        Favorite.objects.create(user=self.user, recipe_id=second)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("recipe-favorite-bulk"),
+                {"ids": [first, second, 999999, third, first]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["id"], item["status"]) for item in response.data],
+            [(first, 201), (second, 400), (999999, 404), (third, 201)],
+        )
+        # Insert, lookup of the ids not inserted, counter update.
+        self.assertEqual(len([q for q in queries if "SAVEPOINT" not in q["sql"]]), 3)
+        self.assertEqual(
+            set(
+                Favorite.objects.filter(user=self.user).values_list(
+                    "recipe_id", flat=True
+                )
+            ),
+            {first, second, third},
+        )
+        self.assertEqual(
+            list(
+                Recipe.objects.filter(pk__in=[first, third]).values_list(
+                    "favorites_count", flat=True
+                )
+            ),
+            [1, 1],
+        )
+
+    def test_bulk_cart_updates_shopping_list(self):
+        """Test that a bulk cart restore adds every recipe to the list"""
+        response = self.client.post(
+            reverse("recipe-shopping-cart-bulk"),
+            {"ids": [recipe.id for recipe in self.recipes]},
+            format="json",
+        )
+        self.assertEqual([item["status"] for item in response.data], [201] * 3)
+        item = ShoppingListItem.objects.get(user=self.user, ingredient=self.salt)
+        self.assertEqual(item.total_amount, 15)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.shopping_cart_modified)
+
+    def test_bulk_subscribe(self):
+        """Test that a bulk subscribe rejects the user and repeated authors"""
+        url = reverse("users-subscribe-bulk")
+        ids = [self.author.id, self.user.id, 999999]
+        response = self.client.post(url, {"ids": ids}, format="json")
+        self.assertEqual([item["status"] for item in response.data], [201, 400, 404])
+        response = self.client.post(url, {"ids": [self.author.id]}, format="json")
+        self.assertEqual(response.data[0]["status"], 400)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+
+    @override_settings(BULK_MAX_IDS=2)
+    def test_bulk_size_is_limited(self):
+        """Test that empty, oversized and out-of-range id lists are rejected"""
+        url = reverse("recipe-favorite-bulk")
+        for ids in ([], [1, 2, 3], ["x"], [2**63]):
+            with self.subTest(ids=ids):
+                response = self.client.post(url, {"ids": ids}, format="json")
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+
+class SubscriptionFeedTest(APITestCase):
+    def setUp(self):
+        response_cache.get_cache().clear()
+        self.reader = User.objects.create_user(
+            email="reader@example.com",
+            username="reader",
+            first_name="Reader",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.author = User.objects.create_user(
+            email="writer@example.com",
+            username="writer",
+            first_name="Writer",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.star = User.objects.create_user(
+            email="star@example.com",
+            username="star",
+            first_name="Star",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.url = reverse("recipe-feed")
+        self.client.force_authenticate(self.reader)
+
+    def create_recipe(self, author, name):
+        return Recipe.objects.create(
+            author=author,
+            name=name,
+            image="recipes/test.png",
+            text="text",
+            cooking_time=10,
+        )
+
+    def feed_names(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe["name"] for recipe in response.data["results"]]
+
+    def test_subscribe_backfills_and_unsubscribe_trims(self):
+        """Test that following an author fills the feed and unfollowing empties it"""
+        self.create_recipe(self.author, "old")
+        subscribe = reverse("users-subscribe", args=[self.author.id])
+        self.client.post(subscribe)
+        self.assertEqual(self.feed_names(), ["old"])
+        self.client.delete(subscribe)
+        self.assertEqual(self.feed_names(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_new_recipes_fan_out_to_subscribers(self):
+        """Test that a published recipe lands in the subscribers' feeds"""
+        Subscription.objects.create(user=self.reader, author=self.author)
+        self.create_recipe(self.author, "fresh")
+        self.assertEqual(
+            list(FeedEntry.objects.values_list("user_id", flat=True)), [self.reader.id]
+        )
+        self.assertEqual(self.feed_names(), ["fresh"])
+
+    @override_settings(FEED_FANOUT_MAX_SUBSCRIBERS=0)
+    def test_big_authors_are_merged_on_read(self):
+        """Test that recipes of authors over the threshold are read live"""
+        self.client.post(reverse("users-subscribe", args=[self.star.id]))
+        self.create_recipe(self.star, "popular")
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed_names(), ["popular"])
+
+    def test_keyset_pages(self):
+        """Test that pages follow each other without gaps or repeats"""
+        Subscription.objects.create(user=self.reader, author=self.author)
+        for i in range(5):
+            self.create_recipe(self.author, f"recipe {i}")
+        response = self.client.get(self.url, {"limit": 2})
+        names = [recipe["name"] for recipe in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            names += [recipe["name"] for recipe in response.data["results"]]
+        self.assertEqual(names, [f"recipe {i}" for i in reversed(range(5))])
+        self.assertEqual(self.client.get(self.url, {"cursor": "x"}).status_code, 404)
+
+    @override_settings(FEED_BACKFILL_SIZE=2)
+    def test_migration_fills_existing_feeds(self):
+        """Test that subscriptions from before the feeds get their entries"""
+        for name in ["first", "second", "third"]:
+            self.create_recipe(self.author, name)
+        Subscription.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed_names(), [])
+        migration = import_module("recipes.migrations.0010_feed_entries")
+        migration.fill_feeds(apps, None)
+        self.assertEqual(self.feed_names(), ["third", "second"])
+
+    def test_rebuild_command(self):
+        """Test that feeds can be refilled from the subscriptions"""
+        self.create_recipe(self.author, "soup")
+        Subscription.objects.create(user=self.reader, author=self.author)
+        call_command("rebuild_feeds", stdout=StringIO())
+        self.assertEqual(self.feed_names(), ["soup"])
@@ -1,7 +1,13 @@
 # Django core imports
-from django.db.models import Sum
-from django.http import HttpResponse
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
 # Third-party imports
 from django_filters.rest_framework import DjangoFilterBackend
@@ -10,13 +16,18 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 # Local application imports
-from users.views import (
-    StandardResultsSetPagination,
-)
-from .filters import IngredientFilter, RecipeFilter
-from .models import Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart
+from core import metrics, relations
+from core.counters import increment, increment_returning
+from core.pagination import KeysetOrPageNumberPagination
+from . import ingredient_index, overlay, response_cache, shopping_list
+from .feed import FeedPagination
+from .filters import IngredientFilter, RecipeFilter, RecipeSearchFilter
+from .models import Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListItem
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (
+    RECIPE_MINIFIED_FIELDS,
+    BulkIdsSerializer,
     IngredientSerializer,
     RecipeCreateUpdateSerializer,
     RecipeListSerializer,
@@ -24,19 +35,62 @@ from .serializers import (
 )
 
 
-
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all().order_by("-pub_date")
     permission_classes = [IsAuthorOrAdminOrReadOnly]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetOrPageNumberPagination
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        RecipeSearchFilter,
         filters.OrderingFilter,
     ]
     filterset_class = RecipeFilter
     search_fields = ["name", "author__username"]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ["list", "retrieve"]:
+            return queryset
+        if self.request.user.is_authenticated:
+            # Payloads come from the shared cache, only ids are needed here.
+            return queryset.only("id", "author_id", "pub_date")
+        return queryset.for_listing(None)
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return response_cache.cached_response(
+                request,
+                ["list"],
+                [response_cache.LIST_GENERATION],
+                lambda: super(RecipeViewSet, self).list(request, *args, **kwargs),
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = queryset if page is None else page
+        data = overlay.personalize(request, [recipe.id for recipe in recipes])
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            pk = kwargs[self.lookup_field]
+            # "05" would be cached under a generation no signal ever bumps.
+            if not pk.isdigit() or str(int(pk)) != pk:
+                raise Http404
+            pk = int(pk)
+            return response_cache.cached_response(
+                request,
+                ["detail", pk],
+                [
+                    response_cache.recipe_generation_key(pk),
+                    response_cache.INGREDIENTS_GENERATION,
+                ],
+                lambda: super(RecipeViewSet, self).retrieve(request, *args, **kwargs),
+            )
+        instance = self.get_object()
+        return Response(overlay.personalize(request, [instance.id])[0])
+
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
             return RecipeCreateUpdateSerializer
@@ -45,30 +99,48 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def toggle(self, request, pk, model, counter):
+        """Add (POST) or remove (DELETE) the user's ``model`` row for recipe ``pk``.
+
+        The row is written by one ``INSERT ... ON CONFLICT DO NOTHING`` or
+        ``DELETE`` that reports whether it changed anything, so a repeated or
+        concurrent request gets a 400 rather than an ``IntegrityError``.
+        Returns the recipe, loaded by the counter update, or ``None`` if
+        nothing changed. No model signals are sent.
+        """
+        if not str(pk).isdigit():
+            raise Http404
+        if request.method == "POST":
+            changed, delta = relations.add(model, request.user.pk, "recipe", pk), 1
+        else:
+            changed, delta = relations.remove(model, request.user.pk, "recipe", pk), -1
+        if not changed:
+            return None
+        return increment_returning(
+            Recipe, pk, RECIPE_MINIFIED_FIELDS, **{counter: delta}
+        )
+
+    def toggle_failed(self, pk, error):
+        get_object_or_404(Recipe.objects.only("id"), pk=pk)
+        return Response({"errors": error}, status=status.HTTP_400_BAD_REQUEST)
+
     @action(
         detail=True,
         methods=["post", "delete"],
         permission_classes=[permissions.IsAuthenticated],
     )
     def favorite(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        user = request.user
+        with transaction.atomic():
+            recipe = self.toggle(request, pk, Favorite, "favorites_count")
         if request.method == "POST":
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
-                return Response(
-                    {"errors": "Рецепт уже в избранном"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            Favorite.objects.create(user=user, recipe=recipe)
+            if recipe is None:
+                return self.toggle_failed(pk, "Рецепт уже в избранном")
+            metrics.FAVORITES_ADDED.inc()
             serializer = RecipeMinifiedSerializer(recipe, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if not Favorite.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {"errors": "Рецепта нет в избранном"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        Favorite.objects.filter(user=user, recipe=recipe).delete()
+        if recipe is None:
+            return self.toggle_failed(pk, "Рецепта нет в избранном")
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -77,59 +149,144 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def shopping_cart(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
         user = request.user
+        with transaction.atomic():
+            recipe = self.toggle(request, pk, ShoppingCart, "shopping_cart_count")
+            if recipe is not None:
+                if request.method == "POST":
+                    shopping_list.add_recipe(user.pk, recipe)
+                else:
+                    shopping_list.remove_recipe(user.pk, recipe)
+                shopping_list.touch_shopping_carts([user.pk])
         if request.method == "POST":
-            if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-                return Response(
-                    {"errors": "Рецепт уже в списке покупок"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            ShoppingCart.objects.create(user=user, recipe=recipe)
+            if recipe is None:
+                return self.toggle_failed(pk, "Рецепт уже в списке покупок")
             serializer = RecipeMinifiedSerializer(recipe, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         # DELETE request part
-        if not ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {"errors": "Рецепта нет в списке покупок"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
+        if recipe is None:
+            return self.toggle_failed(pk, "Рецепта нет в списке покупок")
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def bulk_add(self, request, model, counter):
+        """Add every recipe in the request body to the user's ``model`` rows.
+
+        Returns the requested ids and the ``(added, missing)`` sets.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        added, missing = relations.bulk_add(model, request.user.pk, "recipe", ids)
+        if added:
+            increment(Recipe.objects.filter(pk__in=added), **{counter: 1})
+        return ids, added, missing
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="favorite/bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        with transaction.atomic():
+            ids, added, missing = self.bulk_add(request, Favorite, "favorites_count")
+        metrics.FAVORITES_ADDED.inc(len(added))
+        return Response(
+            relations.bulk_results(
+                ids, added, missing, "Рецепт уже в избранном", "Рецепт не найден."
+            )
+        )
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="shopping_cart/bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def shopping_cart_bulk(self, request):
+        user = request.user
+        with transaction.atomic():
+            ids, added, missing = self.bulk_add(
+                request, ShoppingCart, "shopping_cart_count"
+            )
+            if added:
+                shopping_list.add_recipes(user.pk, added)
+                shopping_list.touch_shopping_carts([user.pk])
+        return Response(
+            relations.bulk_results(
+                ids,
+                added,
+                missing,
+                "Рецепт уже в списке покупок",
+                "Рецепт не найден.",
+            )
+        )
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        """Recipes of the authors the user follows, newest first."""
+        paginator = FeedPagination()
+        recipe_ids = paginator.paginate_feed(request.user, request)
+        return paginator.get_paginated_response(
+            overlay.personalize(request, recipe_ids)
+        )
+
     @action(
-        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
     def download_shopping_cart(self, request):
         user = request.user
-        ingredients_summary = (
-            RecipeIngredient.objects.filter(recipe__in_shopping_carts__user=user)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(total_amount=Sum("amount"))
-            .order_by("ingredient__name")
+        renderer = request.accepted_renderer
+        modified = user.shopping_cart_modified
+        version = modified.timestamp() if modified else 0
+        etag = quote_etag(f"{user.pk}-{version}-{renderer.format}")
+        last_modified = int(modified.timestamp()) if modified else None
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
         )
+        if not_modified is not None:
+            return not_modified
 
-        if not ingredients_summary.exists():
+        rows = (
+            ShoppingListItem.objects.filter(user=user)
+            .values(
+                "total_amount",
+                name=F("ingredient__name"),
+                measurement_unit=F("ingredient__measurement_unit"),
+            )
+            .order_by("name")
+            .iterator(chunk_size=500)
+        )
+        first_row = next(rows, None)
+        if first_row is None:
             return Response(
                 {"errors": "Список покупок пуст или не содержит ингредиентов"},
                 status=status.HTTP_400_BAD_REQUEST,
+                content_type="application/json; charset=utf-8",
             )
 
-        shopping_list_lines = ["Список покупок:", ""]
-        for item in ingredients_summary:
-            line = (
-                f"- {item['ingredient__name']} "
-                f"({item['ingredient__measurement_unit']}): "
-                f"{item['total_amount']}"
-            )
-            shopping_list_lines.append(line)
-
-        shopping_list_content = "\n".join(shopping_list_lines)
-        response = HttpResponse(
-            shopping_list_content, content_type="text/plain; charset=utf-8"
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f"; charset={renderer.charset}"
+        response = StreamingHttpResponse(
+            renderer.stream(chain([first_row], rows)), content_type=content_type
         )
-        response["Content-Disposition"] = 'attachment; filename="shopping_list.txt"'
+        response["Content-Disposition"] = (
+            f'attachment; filename="{renderer.get_filename()}"'
+        )
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        metrics.SHOPPING_CARTS_DOWNLOADED.labels(renderer.format).inc()
         return response
 
     @action(detail=True, methods=["get"], url_path="get-link")
@@ -149,6 +306,16 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        if not settings.INGREDIENT_SEARCH_INDEX:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get("limit", "")
+        limit = int(limit) if limit.isdigit() else None
+        content = ingredient_index.get_index().search_json(
+            request.query_params.get("name", ""), limit
+        )
+        return HttpResponse(content, content_type="application/json")
+
 
 def recipe_short_link_redirect(request, recipe_id):
     recipe = get_object_or_404(Recipe, pk=recipe_id)
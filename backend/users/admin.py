@@ -5,9 +5,20 @@ from .models import User
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
-    list_display = ("username", "email", "first_name", "last_name", "is_staff")
+    list_display = (
+        "username",
+        "email",
+        "first_name",
+        "last_name",
+        "is_staff",
+        "recipes_count",
+        "subscribers_count",
+    )
+    readonly_fields = ("recipes_count", "subscribers_count")
     search_fields = ("username", "email")
-    fieldsets = BaseUserAdmin.fieldsets + ((None, {"fields": ("avatar",)}),)
+    fieldsets = BaseUserAdmin.fieldsets + (
+        (None, {"fields": ("avatar", "recipes_count", "subscribers_count")}),
+    )
     add_fieldsets = BaseUserAdmin.add_fieldsets + (
         (
             None,
@@ -0,0 +1,125 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.cache import LRUCache
+
+from .models import User
+
+KEY_PREFIX = "users:auth:token"
+# Fields loaded from the cache: those permissions and UserSerializer need.
+# Counters and timestamps change without a save() and are read from the
+# database when first accessed instead.
+SNAPSHOT_FIELDS = [
+    field.attname
+    for field in User._meta.concrete_fields
+    if field.name
+    in {
+        "id",
+        "username",
+        "email",
+        "first_name",
+        "last_name",
+        "is_active",
+        "is_staff",
+        "is_superuser",
+        "avatar",
+        "avatar_variants",
+        "avatar_status",
+    }
+]
+
+_local_cache = None
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        _local_cache = LRUCache(
+            settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL
+        )
+    return _local_cache
+
+
+def get_shared_cache():
+    alias = settings.AUTH_TOKEN_SHARED_CACHE_ALIAS
+    return caches[alias] if alias else None
+
+
+def cache_key(token_key):
+    # Only a digest of the token is used, so cache contents do not leak it.
+    return f"{KEY_PREFIX}:{hashlib.sha256(token_key.encode()).hexdigest()}"
+
+
+def snapshot(user):
+    values = (getattr(user, name) for name in SNAPSHOT_FIELDS)
+    return tuple(
+        value.name if isinstance(value, FieldFile) else value for value in values
+    )
+
+
+def restore(values):
+    return User.from_db(DEFAULT_DB_ALIAS, SNAPSHOT_FIELDS, values)
+
+
+def forget_token(token_key):
+    key = cache_key(token_key)
+    get_local_cache().delete(key)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(key)
+
+
+def forget_user(user_id):
+    for token_key in Token.objects.filter(user_id=user_id).values_list(
+        "key", flat=True
+    ):
+        forget_token(token_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches token→user snapshots.
+
+    Snapshots are kept for ``AUTH_TOKEN_CACHE_TTL`` seconds in the cache
+    named by ``AUTH_TOKEN_SHARED_CACHE_ALIAS``, or else in a per-worker LRU.
+    Logging out, saving or deleting a user drops them. A per-worker copy
+    next to the shared cache would outlive drops made by other workers, so
+    the LRU is only used without one, e.g. with a single worker process.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_entry_key = cache_key(key)
+        shared = get_shared_cache()
+        cache = get_local_cache() if shared is None else shared
+        values = cache.get(cache_entry_key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            values = snapshot(user)
+            if shared is None:
+                cache.set(cache_entry_key, values)
+            else:
+                cache.set(cache_entry_key, values, settings.AUTH_TOKEN_CACHE_TTL)
+
+        user = restore(values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return user, Token(key=key, user=user)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    forget_user(instance.pk)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="shopping_cart_modified",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,10 +1,22 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from recipes.models import ImageStatus
+
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    avatar_status = models.CharField(
+        max_length=10,
+        choices=ImageStatus.choices,
+        default=ImageStatus.READY,
+        editable=False,
+    )
+    shopping_cart_modified = models.DateTimeField(blank=True, null=True)
+    recipes_count = models.PositiveIntegerField(default=0, editable=False)
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
@@ -4,11 +4,15 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.authtoken.models import Token
 from .models import User
-from recipes.fields import Base64ImageField
+from core.thumbnails import AVATAR_THUMBNAIL_WIDTH
+from recipes.fields import Base64ImageField, SrcsetField, ThumbnailField
+from recipes.image_queue import DeferredImageMixin
+from recipes.models import Recipe
 import logging
 import re
 from djoser.serializers import UserCreateSerializer as DjoserUserCreateSerializer
 from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import cached_property
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +39,8 @@ class UserCreateSerializer(DjoserUserCreateSerializer):
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_thumbnail = ThumbnailField("avatar", AVATAR_THUMBNAIL_WIDTH)
+    avatar_srcset = SrcsetField("avatar")
 
     class Meta:
         model = User
@@ -46,6 +52,9 @@ class UserSerializer(serializers.ModelSerializer):
             "last_name",
             "is_subscribed",
             "avatar",
+            "avatar_thumbnail",
+            "avatar_srcset",
+            "avatar_status",
         )
         read_only_fields = ("id", "is_subscribed")
 
@@ -70,6 +79,8 @@ class UserSerializer(serializers.ModelSerializer):
         ):
             return False
 
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return obj.subscribers.filter(user=current_user).exists()
 
     def to_representation(self, instance):
@@ -81,6 +92,9 @@ class UserSerializer(serializers.ModelSerializer):
                 "first_name": None,
                 "last_name": None,
                 "avatar": None,
+                "avatar_thumbnail": None,
+                "avatar_srcset": {},
+                "avatar_status": None,
                 "is_subscribed": False,
             }
         representation = super().to_representation(instance)
@@ -97,38 +111,67 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ("avatar",)
 
 
+class UserWithRecipesListSerializer(serializers.ListSerializer):
+    """Loads the recipes of every author on the page in one query."""
+
+    def to_representation(self, data):
+        authors = list(data)
+        recipes = {}
+        for recipe in self.child.get_recipes_queryset(
+            [author.pk for author in authors]
+        ):
+            recipes.setdefault(recipe.author_id, []).append(recipe)
+        for author in authors:
+            author.latest_recipes = recipes.get(author.pk, [])
+        return super().to_representation(authors)
+
+
 class UserWithRecipesSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ("recipes", "recipes_count")
+        list_serializer_class = UserWithRecipesListSerializer
+
+    @cached_property
+    def recipes_limit(self):
+        request = self.context.get("request")
+        try:
+            limit = int(request.query_params["recipes_limit"])
+        except (AttributeError, KeyError, ValueError):
+            return None
+        return max(limit, 0)
+
+    def get_recipes_queryset(self, author_ids):
+        """The newest ``recipes_limit`` recipes of each author, in one query."""
+        from recipes.serializers import RECIPE_MINIFIED_FIELDS
+
+        return (
+            Recipe.objects.filter(author_id__in=author_ids)
+            .only("author", "pub_date", *RECIPE_MINIFIED_FIELDS)
+            .latest_per_author(self.recipes_limit)
+        )
 
     def get_recipes(self, obj):
         from recipes.serializers import RecipeMinifiedSerializer
 
-        request = self.context.get("request")
-        limit = request.query_params.get("recipes_limit") if request else None
-        recipes_queryset = obj.recipes.all()
-        if limit:
-            try:
-                recipes_queryset = recipes_queryset[: int(limit)]
-            except ValueError:
-                pass
-        return RecipeMinifiedSerializer(
-            recipes_queryset, many=True, context=self.context
-        ).data
+        recipes = getattr(obj, "latest_recipes", None)
+        if recipes is None:
+            recipes = self.get_recipes_queryset([obj.pk])
+        return RecipeMinifiedSerializer(recipes, many=True, context=self.context).data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
-class UserAvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField(required=True, allow_null=False)
+class UserAvatarSerializer(DeferredImageMixin, serializers.ModelSerializer):
+    avatar = Base64ImageField(required=True, allow_null=False, deferrable=True)
+    deferred_image_fields = ("avatar",)
 
     class Meta:
         model = User
-        fields = ("avatar",)
+        fields = ("avatar", "avatar_status")
 
 
 class AuthTokenSerializer(serializers.Serializer):
@@ -1,9 +1,24 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 
+from core.cache import LRUCache
+from recipes.models import Recipe, Subscription
+from .authentication import (
+    CachedTokenAuthentication,
+    cache_key,
+    get_local_cache,
+)
+
 User = get_user_model()
 
 
@@ -57,3 +72,151 @@ class AuthenticationTest(APITestCase):
             url, {"email": "wrong@example.com", "password": self.user_data["password"]}
         )
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        get_local_cache().clear()
+        self.user = User.objects.create_user(
+            email="cached@example.com",
+            username="cached",
+            first_name="Cached",
+            last_name="User",
+            password="testpassword123",
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.authentication = CachedTokenAuthentication()
+
+    def test_repeated_requests_skip_the_database(self):
+        """Test that only the first authentication queries the database"""
+        with self.assertNumQueries(1):
+            self.authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.username, "cached")
+        self.assertEqual(token.key, self.token.key)
+
+    def test_fields_outside_the_snapshot_are_read_fresh(self):
+        """Test that counters changed by UPDATE queries are not stale"""
+        self.authentication.authenticate_credentials(self.token.key)
+        User.objects.filter(pk=self.user.pk).update(recipes_count=7)
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user.recipes_count, 7)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE_ALIAS="default")
+    def test_shared_cache_tier(self):
+        """Test that another worker finds the snapshot in the shared cache"""
+        self.authentication.authenticate_credentials(self.token.key)
+        get_local_cache().clear()
+        with self.assertNumQueries(0):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE_ALIAS="default")
+    def test_shared_cache_drops_reach_every_worker(self):
+        """Test that no per-worker copy outlives a drop by another worker"""
+        self.authentication.authenticate_credentials(self.token.key)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        # Another worker saving the user only clears its own LRU and the
+        # shared entry.
+        caches["default"].delete(cache_key(self.token.key))
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_logout_invalidates_the_token(self):
+        """Test that a destroyed token stops working immediately"""
+        url = reverse("users-me")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse("logout"))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_and_password_change_invalidate_the_snapshot(self):
+        """Test that saving the user drops the cached snapshot"""
+        self.authentication.authenticate_credentials(self.token.key)
+        self.user.set_password("newpassword456")
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.authentication.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+
+class LRUCacheTest(TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test that the cache keeps at most maxsize entries"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after ttl seconds"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        with mock.patch("core.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with mock.patch("core.cache.time.monotonic", return_value=159):
+            self.assertEqual(cache.get("a"), 1)
+        with mock.patch("core.cache.time.monotonic", return_value=160):
+            self.assertIsNone(cache.get("a"))
+
+
+class SubscriptionsQueryCountTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="follower@example.com",
+            username="follower",
+            first_name="Follower",
+            last_name="User",
+            password="testpassword123",
+        )
+        for i in range(8):
+            author = User.objects.create_user(
+                email=f"author{i}@example.com",
+                username=f"author{i}",
+                first_name="Author",
+                last_name=f"User{i}",
+                password="testpassword123",
+            )
+            Subscription.objects.create(user=self.user, author=author)
+            for j in range(3):
+                Recipe.objects.create(
+                    author=author,
+                    name=f"recipe {i}.{j}",
+                    image="recipes/test.png",
+                    text="text",
+                    cooking_time=10,
+                )
+        self.client.force_authenticate(self.user)
+        self.url = reverse("users-subscriptions")
+
+    def _count_queries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {"limit": limit, "recipes_limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), limit)
+        return len(context)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Test that authors' recipes are loaded in one query for the page"""
+        self.assertEqual(self._count_queries(2), self._count_queries(8))
+
+    def test_recipes_limit_keeps_newest(self):
+        """Test that recipes_limit keeps each author's newest recipes"""
+        response = self.client.get(self.url, {"limit": 1, "recipes_limit": 2})
+        author = response.data["results"][0]
+        self.assertTrue(author["is_subscribed"])
+        self.assertEqual(
+            [recipe["name"] for recipe in author["recipes"]],
+            ["recipe 7.2", "recipe 7.1"],
+        )
+        response = self.client.get(self.url, {"limit": 1, "recipes_limit": "x"})
+        self.assertEqual(len(response.data["results"][0]["recipes"]), 3)
@@ -1,10 +1,18 @@
+from django.db import transaction
+from django.db.models import F, Value
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from users.models import User
+from recipes import feed
 from recipes.models import Subscription
+from recipes.serializers import BulkIdsSerializer
 
+from core import relations
+from core.counters import increment, increment_returning
+from core.pagination import KeysetOrPageNumberPagination, KeysetPagination
 from djoser import views as djoser_views
 from .serializers import (
     UserSerializer,
@@ -16,6 +24,18 @@ from .serializers import (
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 
+# Columns ``UserWithRecipesSerializer`` reads from the author row.
+AUTHOR_FIELDS = (
+    "email",
+    "username",
+    "first_name",
+    "last_name",
+    "avatar",
+    "avatar_variants",
+    "avatar_status",
+    "recipes_count",
+)
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 6
@@ -23,6 +43,14 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ("-subscription_id",)
+
+
+class SubscriptionPagination(KeysetOrPageNumberPagination):
+    keyset_pagination_class = SubscriptionKeysetPagination
+
+
 class UserViewSet(djoser_views.UserViewSet):
     pagination_class = StandardResultsSetPagination
 
@@ -47,46 +75,96 @@ class UserViewSet(djoser_views.UserViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def subscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
+        """Subscribe to or unsubscribe from the author ``id``.
+
+        Like the recipe toggles, the subscription is written by a single
+        statement that reports whether it changed anything.
+        """
         user = request.user
+        if not str(id).isdigit():
+            raise Http404
 
         if request.method == "POST":
-            if user == author:
+            if str(user.pk) == id:
                 return Response(
                     {"errors": "Вы не можете подписаться на самого себя."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            if Subscription.objects.filter(user=user, author=author).exists():
+            with transaction.atomic():
+                author = None
+                if relations.add(Subscription, user.pk, "author", id):
+                    author = increment_returning(
+                        User, id, AUTHOR_FIELDS, subscribers_count=1
+                    )
+                    feed.backfill(user.pk, [author.pk])
+            if author is None:
+                get_object_or_404(User.objects.only("id"), id=id)
                 return Response(
                     {"errors": "Вы уже подписаны на этого пользователя."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-
-            Subscription.objects.create(user=user, author=author)
+            author.is_subscribed = True
             serializer = UserWithRecipesSerializer(author, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         elif request.method == "DELETE":
-            subscription = Subscription.objects.filter(user=user, author=author)
-            if not subscription.exists():
+            with transaction.atomic():
+                removed = relations.remove(Subscription, user.pk, "author", id)
+                if removed:
+                    increment(User.objects.filter(pk=id), subscribers_count=-1)
+                    feed.trim(user.pk, [id])
+            if not removed:
+                get_object_or_404(User.objects.only("id"), id=id)
                 return Response(
                     {"errors": "Вы не были подписаны на этого пользователя."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            subscription.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="subscribe/bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def subscribe_bulk(self, request):
+        user = request.user
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        with transaction.atomic():
+            added, missing = relations.bulk_add(
+                Subscription, user.pk, "author", [pk for pk in ids if pk != user.pk]
+            )
+            if added:
+                increment(User.objects.filter(pk__in=added), subscribers_count=1)
+                feed.backfill(user.pk, added)
+        return Response(
+            relations.bulk_results(
+                ids,
+                added,
+                missing,
+                "Вы уже подписаны на этого пользователя.",
+                "Пользователь не найден.",
+                rejected={user.pk: "Вы не можете подписаться на самого себя."},
+            )
+        )
+
     @action(
         detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
     )
     def subscriptions(self, request):
         user = request.user
-        subscribed_authors = User.objects.filter(subscribers__user=user)
+        subscribed_authors = (
+            User.objects.filter(subscribers__user=user)
+            .annotate(subscription_id=F("subscribers__id"), is_subscribed=Value(True))
+            .order_by("-subscription_id")
+        )
 
-        paginator = StandardResultsSetPagination()
-        page = paginator.paginate_queryset(subscribed_authors, request)
+        paginator = SubscriptionPagination()
+        page = paginator.paginate_queryset(subscribed_authors, request, view=self)
 
         serializer = UserWithRecipesSerializer(
             page, many=True, context={"request": request}